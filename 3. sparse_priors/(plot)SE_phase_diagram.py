@@ -0,0 +1,35 @@
+import matplotlib.pyplot as plt
+plt.rcParams['font.family'] = 'serif'
+plt.rcParams['font.serif'] = ['Times New Roman'] + plt.rcParams['font.serif']
+
+import numpy as np
+from numpy import load
+import seaborn as sns
+
+'''
+SE heatmaps saved by (run)SE_phase_diagram.py, drawn like those of
+(plot)GAMP_sparse_prior.py with eps decreasing from top to bottom.
+'''
+
+eps_list = load('SE_heatmap_eps_list.npy')
+delta_list = load('SE_heatmap_delta_list.npy')
+
+num_ticks = 10
+x_ticks = np.linspace(0, len(delta_list) - 1, num_ticks).round().astype(int)
+y_ticks = np.linspace(0, len(eps_list) - 1, num_ticks).round().astype(int)
+
+for p1 in [0.6, 0.7, 0.8]:
+  min_corr_matrix = load('SE_heatmap_' + str(p1) + 'p1.npy')
+
+  plt.clf()
+  sns.set(font_scale=1.5)
+  plt.rcParams['font.family'] = 'serif'
+  plt.rcParams['font.serif'] = ['Times New Roman'] + plt.rcParams['font.serif']
+  ax = sns.heatmap(min_corr_matrix[::-1], xticklabels=False, yticklabels=False, cmap="YlGnBu", vmin=0, vmax=1)
+  ax.set_xticks(x_ticks + 0.5)
+  ax.set_xticklabels(np.round(delta_list[x_ticks], 1))
+  ax.set_yticks(y_ticks + 0.5)
+  ax.set_yticklabels(np.round(eps_list[::-1][y_ticks], 1))
+  plt.xlabel(r'$\delta$')
+  plt.ylabel(r'$\epsilon$')
+  plt.savefig("SE_heatmap_" + str(p1) + "p1.pdf", bbox_inches='tight')
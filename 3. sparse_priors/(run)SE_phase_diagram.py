@@ -0,0 +1,39 @@
+import numpy as np
+from numpy import save
+
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from matrix_gamp import sparse_MLR_min_corr, phase_diagram
+
+'''
+The heatmaps of (run)GAMP_sparse_prior.py from the state evolution instead of GAMP:
+the min over the two signals of the SE norm sq corr on a dense (eps, delta) grid,
+one grid per p1. The rows of a grid go with eps_list and the columns with
+delta_list, and "evaluated" marks the points where the SE was run rather than
+interpolated. Compare against a few cells simulated with (run)GAMP_sparse_prior.py.
+'''
+
+def get_SE_heatmap(p1, sigma, eps_list, alpha, delta_list, num_iter, num_points=8, coarse_step=16, tol=0.01):
+  def evaluate(eps, delta):
+    return sparse_MLR_min_corr(eps, delta, np.full(len(eps), p1), alpha, sigma, num_iter, num_points)
+  return phase_diagram(evaluate, eps_list, delta_list, coarse_step, tol)
+
+if __name__ == '__main__':
+  sigma = 0
+  alpha = 0
+  num_iter = 10
+
+  eps_list = np.linspace(0.1, 1, 200)
+  delta_list = np.linspace(0.5, 5, 200)
+
+  for p1 in [0.6, 0.7, 0.8]:
+    start = time.time()
+    data, evaluated = get_SE_heatmap(p1, sigma, eps_list, alpha, delta_list, num_iter)
+    print('p1 = ' + str(p1) + ': ' + str(np.sum(evaluated)) + ' points in ' + str(time.time() - start) + ' s')
+
+    save('SE_heatmap_' + str(p1) + 'p1', data)
+    save('SE_heatmap_evaluated_' + str(p1) + 'p1', evaluated)
+  save('SE_heatmap_eps_list', eps_list)
+  save('SE_heatmap_delta_list', delta_list)
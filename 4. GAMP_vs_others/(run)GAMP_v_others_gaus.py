@@ -10,165 +10,10 @@ from numpy.random import binomial
 from numpy.random import uniform
 from numpy import save
 
-from scipy.stats import multivariate_normal as multivariate_normal_sp
-from scipy.linalg import eigh
-
-# Copied this function over from scipy library
-def _eigvalsh_to_eps(spectrum, cond=None, rcond=None):
-    if rcond is not None:
-        cond = rcond
-    if cond in [None, -1]:
-        t = spectrum.dtype.char.lower()
-        factor = {'f': 1E3, 'd': 1E6}
-        cond = factor[t] * np.finfo(t).eps
-    eps = cond * np.max(abs(spectrum))
-    return eps
-
-# Copied this function over from scipy library
-def is_pos_semi_def_scipy(matrix):
-  s, u = eigh(matrix)
-  eps = _eigvalsh_to_eps(s)
-  if np.min(s) < -eps:
-    #print('the input matrix must be positive semidefinite')
-    return False
-  else:
-    return True
-
-def norm_pdf(x, mean, var):
-  first_part = 1 / np.sqrt(2 * np.pi * var)
-  second_part = np.exp((-1/2) * ((x - mean) ** 2 / var))
-  return first_part * second_part
-
-def multi_norm_pdf(x, mean, cov): # multivariate normal distribution
-  dimension = len(x)
-  first_part = 1 / np.sqrt((2 * np.pi) ** dimension * linalg.det(cov))
-  second_part = np.exp((-1/2) * np.dot(np.dot((x - mean).T, linalg.pinv(cov)), (x - mean)))
-  return first_part * second_part
-
-def generate_Sigma_0(delta, B_bar_mean, B_bar_cov, B_hat_0_row_mean, B_hat_0_row_cov):
-  
-  Sigma_0 = np.zeros((4, 4))
-  
-  Sigma_0[0, 0] = B_bar_cov[0, 0] + B_bar_mean[0]**2
-  Sigma_0[0, 1] = B_bar_cov[0, 1] + B_bar_mean[0] * B_bar_mean[1]
-  Sigma_0[1, 0] = Sigma_0[0, 1]
-  Sigma_0[1, 1] = B_bar_cov[1, 1] + B_bar_mean[1]**2
-
-  Sigma_0[0, 2] = B_bar_mean[0] * B_hat_0_row_mean[0]
-  Sigma_0[0, 3] = B_bar_mean[0] * B_hat_0_row_mean[1]
-  Sigma_0[1, 2] = B_bar_mean[1] * B_hat_0_row_mean[0]
-  Sigma_0[1, 3] = B_bar_mean[1] * B_hat_0_row_mean[1]
-
-  Sigma_0[2, 2] = B_hat_0_row_cov[0, 0] + B_hat_0_row_mean[0]**2
-  Sigma_0[2, 3] = B_hat_0_row_cov[0, 1] + B_hat_0_row_mean[0] * B_hat_0_row_mean[1]
-  Sigma_0[3, 2] = Sigma_0[2, 3]
-  Sigma_0[3, 3] = B_hat_0_row_cov[1, 1] + B_hat_0_row_mean[1]**2
-
-  Sigma_0[2:, :2] = Sigma_0[:2, 2:].T
-
-  return Sigma_0 / delta
-
-'''
-Our GAMP functions below -- note that the inputs Z_k and Y_bar will be exchanged
-for Theta^k_i and Y_i in our matrix-GAMP algorithm.
-'''
-
-def Var_Z_given_Zk(Sigma_k):
-  return Sigma_k[0:2, 0:2] - np.dot(np.dot(Sigma_k[0:2, 2:4], linalg.pinv(Sigma_k[2:4, 2:4])), Sigma_k[2:4, 0:2])
-
-def E_Z_given_Zk(Sigma_k, Z_k):
-  return np.dot(np.dot(Sigma_k[0:2, 2:4], linalg.pinv(Sigma_k[2:4, 2:4])), Z_k)
-
-def E_Z_given_Zk_Ybar(Z_k, Y_bar, Sigma_k, p1, sigma):
-
-  Sigma_k1_Y = np.zeros((5, 5))
-  Sigma_k1_Y[:4, :4] = Sigma_k
-  Sigma_k1_Y[4, :4] = Sigma_k[0, :]
-  Sigma_k1_Y[:4, 4] = Sigma_k[0, :]
-  Sigma_k1_Y[4, 4] = Sigma_k[0, 0] + sigma**2
-  
-  Sigma_k0_Y = np.zeros((5, 5))
-  Sigma_k0_Y[:4, :4] = Sigma_k
-  Sigma_k0_Y[4, :4] = Sigma_k[1, :]
-  Sigma_k0_Y[:4, 4] = Sigma_k[1, :]
-  Sigma_k0_Y[4, 4] = Sigma_k[1, 1] + sigma**2
-  
-  E_Z_given_Zk_Ybar_cbar1 = np.dot(Sigma_k1_Y[:2, 2:], np.dot(linalg.pinv(Sigma_k1_Y[2:, 2:]), np.concatenate((Z_k, Y_bar))))
-  E_Z_given_Zk_Ybar_cbar0 = np.dot(Sigma_k0_Y[:2, 2:], np.dot(linalg.pinv(Sigma_k0_Y[2:, 2:]), np.concatenate((Z_k, Y_bar))))
-  
-  mean = np.zeros(3)
-  cov1 = Sigma_k1_Y[2:, 2:]
-  cov2 = Sigma_k0_Y[2:, 2:]
-
-  if is_pos_semi_def_scipy(cov1) == False or is_pos_semi_def_scipy(cov2) == False:
-    return np.array([np.nan, np.nan])
-
-  P_Zk_Ybar_given_cbar1 = multivariate_normal_sp.pdf(np.concatenate((Z_k, Y_bar)), mean=mean, cov=cov1, allow_singular=True)
-  P_Zk_Ybar_given_cbar0 = multivariate_normal_sp.pdf(np.concatenate((Z_k, Y_bar)), mean=mean, cov=cov2, allow_singular=True)
-
-  P_cbar1_given_Zk_Ybar = (p1*P_Zk_Ybar_given_cbar1) / (p1*P_Zk_Ybar_given_cbar1 + (1 - p1)*P_Zk_Ybar_given_cbar0)
-  P_cbar0_given_Zk_Ybar = ((1 - p1)*P_Zk_Ybar_given_cbar0) / (p1*P_Zk_Ybar_given_cbar1 + (1 - p1)*P_Zk_Ybar_given_cbar0)
-  
-  output = P_cbar1_given_Zk_Ybar * E_Z_given_Zk_Ybar_cbar1 + P_cbar0_given_Zk_Ybar * E_Z_given_Zk_Ybar_cbar0
-
-  return output
-
-def g_k_bayes(Z_k, Y_bar, Sigma_k, p1, sigma):
-  
-  mat1 = Var_Z_given_Zk(Sigma_k)
-  vec2 = E_Z_given_Zk_Ybar(Z_k, Y_bar, Sigma_k, p1, sigma)
-  vec3 = E_Z_given_Zk(Sigma_k, Z_k)
-  
-  return np.dot(linalg.pinv(mat1), vec2 - vec3)
-
-# wrapper function so that it fits into the requirement of np.apply_along_axis().
-def g_k_bayes_wrapper(Z_k_and_Y_bar, Sigma_k, p1, sigma):
-  Z_k = Z_k_and_Y_bar[:2]
-  Y_bar = Z_k_and_Y_bar[2:]
-  return g_k_bayes(Z_k, Y_bar, Sigma_k, p1, sigma)
-  
-def f_k_bayes(B_bar_k, M_k_B, T_k_B, B_bar_mean, B_bar_cov):
-
-  part1 = linalg.pinv(np.dot(M_k_B, np.dot(B_bar_cov, M_k_B.T)) + T_k_B)
-  part2 = B_bar_k - np.dot(M_k_B, B_bar_mean)
-  output = B_bar_mean + np.dot(np.dot(B_bar_cov, M_k_B.T), np.dot(part1, part2))
-
-  return output
-
-def compute_C_k(Theta_k, R_hat_k, Sigma_k):
-  n = len(Theta_k)
-  part1 = np.dot(Theta_k.T, R_hat_k)/n
-  part2 = np.dot(Sigma_k[2:4,0:2], np.dot(R_hat_k.T, R_hat_k)/n)
-  output = np.dot(linalg.pinv(Sigma_k[2:4,2:4]), part1 - part2)
-  return output.T
-
-# This only holds for jointly Gaussian priors.
-def f_k_prime(M_k_B, T_k_B, B_bar_cov):
-  part1 = linalg.pinv(np.dot(M_k_B, np.dot(B_bar_cov, M_k_B.T)) + T_k_B)
-  output = np.dot(part1, np.dot(M_k_B, B_bar_cov))
-  return output
-
-def norm_sq_corr(beta, beta_hat):
-  num = np.square(np.dot(beta, beta_hat))
-  denom = np.square(linalg.norm(beta)) * np.square(linalg.norm(beta_hat))
-  return num / denom
-
-def get_SD(var_corr_list, mean_corr_list, succ_run_list):
-  
-  num_iter = len(mean_corr_list)
-  num_runs = len(var_corr_list)
-
-  SD_list = np.zeros(num_iter)
-  for iter in range(num_iter):
-    var = 0
-    for run in range(num_runs):
-      corr = var_corr_list[run][iter]
-      if corr > 0:
-        var += (corr - mean_corr_list[iter])**2
-    var = var / succ_run_list[iter]
-    SD_list[iter] = np.sqrt(var)
-
-  return SD_list
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from matrix_gamp import MatrixGAMP, MLRChannel, GaussianPrior, generate_Sigma_0, norm_sq_corr, run_sweep, row_blocks, gaussian_X, cast_like
 
 '''
 Spectral Initialization
@@ -177,21 +22,23 @@ the scalings of X and beta1 and beta2 are different from the paper when
 i compared the algo, but i dont think it matters? 
 '''
 
-def loss(Y, X, beta1, beta2):
-  output = 0
-  for i in range(len(Y)):
-    loss1 = (Y[i] - np.dot(X[i, :], beta1))**2
-    loss2 = (Y[i] - np.dot(X[i, :], beta2))**2
-    output += min(loss1, loss2)
-  return output
+def pair_losses(Y, X, G, block_rows=None):
+  # The loss sum_i min((Y_i - <X_i, u1>)^2, (Y_i - <X_i, u2>)^2) of every pair (u1, u2)
+  # of rows of G, in one pass over the rows of X, block_rows rows at a time.
+  losses = np.zeros((len(G), len(G)))
+  for start, end in row_blocks(X, block_rows):
+    res_sq = (Y[start:end, None] - np.dot(X[start:end], cast_like(X, G.T)))**2
+    for index1 in range(len(G)):
+      losses[index1] += np.sum(np.minimum(res_sq[:, index1, None], res_sq), axis=0)
+  return losses
 
-def spec_init_grid_search(Y, X, n, p, grid_param):
+def spec_init_grid_search(Y, X, n, p, grid_param, block_rows=None):
 
-  # Compute matrix M
+  # Compute matrix M = sum_i Y_i^2 X_i X_i^T / n, block_rows rows of X at a time
   M = np.zeros((p, p))
-  for i in range(n):
-    X_i = X[i, :]
-    M = M + ((Y[i]**2) * np.outer(X_i, X_i))
+  for start, end in row_blocks(X, block_rows):
+    X_b = X[start:end]
+    M += np.dot(X_b.T * cast_like(X, Y[start:end]**2), X_b)
   M = M / n
 
   # # Compute top 2 eigenvector of M
@@ -200,22 +47,14 @@ def spec_init_grid_search(Y, X, n, p, grid_param):
   eigenvector2 = eigenvectors[:, -2]
 
   # Make the grid points
-  G = []
-  for t in range(int(np.ceil((2 * np.pi) / grid_param))):
-    u = eigenvector1 * np.cos(grid_param * t) + eigenvector2 * np.sin(grid_param * t)
-    G.append(u)
+  t = np.arange(int(np.ceil((2 * np.pi) / grid_param)))
+  G = np.outer(np.cos(grid_param * t), eigenvector1) + np.outer(np.sin(grid_param * t), eigenvector2)
 
   # Pick the pair that has the lowest loss
-  current_min = loss(Y, X, G[0], G[1])
-  beta1_0 = G[0]
-  beta2_0 = G[1]
-  for u1 in G:
-    for u2 in G:
-      current_loss = loss(Y, X, u1, u2)
-      if current_loss < current_min:
-        current_min = current_loss
-        beta1_0 = u1
-        beta2_0 = u2
+  losses = pair_losses(Y, X, G, block_rows)
+  index1, index2 = np.unravel_index(np.argmin(losses), losses.shape)
+  beta1_0 = G[index1]
+  beta2_0 = G[index2]
 
   return beta1_0, beta2_0
 
@@ -225,7 +64,7 @@ Expectation Maximization (EM) algorithm
 from: EM: https://arxiv.org/pdf/1905.12106.pdf
 '''
 
-def run_EM(n, p, p1, sigma, X, Y, B_hat_0, num_iter):
+def run_EM(n, p, p1, sigma, X, Y, B_hat_0, num_iter, block_rows=None):
   
   beta1_k = B_hat_0[:, 0]
   beta2_k = B_hat_0[:, 1]
@@ -236,33 +75,29 @@ def run_EM(n, p, p1, sigma, X, Y, B_hat_0, num_iter):
   pi = np.array([0.5, 0.5]) # probability of latent variable being either of the signals
   w = np.zeros((n, 2))
   for k in range(num_iter):
-    # === E step ===
-    for i in range(n):
-      X_i = X[i, :]
-      Y_i = Y[i]
-      num = pi[0] * np.exp(-1 * ((Y_i - np.dot(X_i, beta1_k))**2 / 2))
-      denom = pi[0] * np.exp(-1 * ((Y_i - np.dot(X_i, beta1_k))**2 / 2)) + pi[1] * np.exp(-1 * ((Y_i - np.dot(X_i, beta2_k))**2 / 2))
-      w[i, 0] = num / denom
-      num = pi[1] * np.exp(-1 * ((Y_i - np.dot(X_i, beta2_k))**2 / 2))
-      denom = pi[0] * np.exp(-1 * ((Y_i - np.dot(X_i, beta1_k))**2 / 2)) + pi[1] * np.exp(-1 * ((Y_i - np.dot(X_i, beta2_k))**2 / 2))
-      w[i, 1] = num / denom
-
-    # === M step ===
+    # The E step and the sums of the M step are done in one pass over the rows
+    # of X, block_rows rows at a time, so X can be a memory map.
     part1_1 = np.zeros((p, p))
     part1_2 = np.zeros((p, p))
-    for i in range(n):
-      X_i = X[i, :]
-      part1_1 += w[i, 0] * np.outer(X_i, X_i)
-      part1_2 += w[i, 1] * np.outer(X_i, X_i)
-    part1_1 = linalg.inv(part1_1 / n)
-    part1_2 = linalg.inv(part1_2 / n)
     part2_1 = np.zeros(p)
     part2_2 = np.zeros(p)
-    for i in range(n):
-      X_i = X[i, :]
-      Y_i = Y[i]
-      part2_1 += w[i, 0] * X_i * Y_i
-      part2_2 += w[i, 1] * X_i * Y_i
+    for start, end in row_blocks(X, block_rows):
+      X_b = X[start:end]
+      Y_b = Y[start:end]
+
+      # === E step ===
+      lik1 = pi[0] * np.exp(-1 * ((Y_b - np.dot(X_b, cast_like(X, beta1_k)))**2 / 2))
+      lik2 = pi[1] * np.exp(-1 * ((Y_b - np.dot(X_b, cast_like(X, beta2_k)))**2 / 2))
+      w[start:end, 0] = lik1 / (lik1 + lik2)
+      w[start:end, 1] = lik2 / (lik1 + lik2)
+
+      # === M step ===
+      part1_1 += np.dot(X_b.T * cast_like(X, w[start:end, 0]), X_b)
+      part1_2 += np.dot(X_b.T * cast_like(X, w[start:end, 1]), X_b)
+      part2_1 += np.dot(cast_like(X, w[start:end, 0] * Y_b), X_b)
+      part2_2 += np.dot(cast_like(X, w[start:end, 1] * Y_b), X_b)
+    part1_1 = linalg.inv(part1_1 / n)
+    part1_2 = linalg.inv(part1_2 / n)
     part2_1 = part2_1 / n
     part2_2 = part2_2 / n
     beta1_k = np.dot(part1_1, part2_1)
@@ -280,7 +115,7 @@ def run_EM(n, p, p1, sigma, X, Y, B_hat_0, num_iter):
 ALternating minimization (AM) algorithm
 '''
 
-def run_AM(n, p, p1, sigma, X, Y, B_hat_0, num_iter):
+def run_AM(n, p, p1, sigma, X, Y, B_hat_0, num_iter, block_rows=None):
 
   delta = n / p
   
@@ -291,20 +126,33 @@ def run_AM(n, p, p1, sigma, X, Y, B_hat_0, num_iter):
   B_hat_storage.append(B_hat_0)
   
   for k in range(num_iter):
-    # AM part I: Guess the labels
-    J1 = []
-    J2 = []
-    for i in range(n):
-      diff1 = np.abs(Y[i] - np.dot(X[i, :], beta1_k)) 
-      diff2 = np.abs(Y[i] - np.dot(X[i, :], beta2_k))
-      if diff1 < diff2:
-        J1.append(i)
-      else:
-        J2.append(i)
-
-    # AM part II: Solve least squares
-    beta1_k = np.linalg.lstsq(np.take(X, J1, axis=0), Y[J1], rcond=None)[0]
-    beta2_k = np.linalg.lstsq(np.take(X, J2, axis=0), Y[J2], rcond=None)[0]
+    # The labels and the normal equations of each group are done in one pass
+    # over the rows of X, block_rows rows at a time, so X can be a memory map.
+    # The normal equations square the condition number of X, so each block is
+    # taken to float64 for them even when X is float32.
+    gram1 = np.zeros((p, p))
+    gram2 = np.zeros((p, p))
+    XTY1 = np.zeros(p)
+    XTY2 = np.zeros(p)
+    for start, end in row_blocks(X, block_rows):
+      X_b = X[start:end].astype(float, copy=False)
+      Y_b = Y[start:end]
+
+      # AM part I: Guess the labels
+      diff1 = np.abs(Y_b - np.dot(X_b, beta1_k))
+      diff2 = np.abs(Y_b - np.dot(X_b, beta2_k))
+      J1 = diff1 < diff2
+      J2 = ~J1
+
+      gram1 += np.dot(X_b[J1].T, X_b[J1])
+      gram2 += np.dot(X_b[J2].T, X_b[J2])
+      XTY1 += np.dot(Y_b[J1], X_b[J1])
+      XTY2 += np.dot(Y_b[J2], X_b[J2])
+
+    # AM part II: Solve least squares (lstsq gives the min-norm solution when a
+    # group has fewer than p rows, as it does on the rows themselves)
+    beta1_k = np.linalg.lstsq(gram1, XTY1, rcond=None)[0]
+    beta2_k = np.linalg.lstsq(gram2, XTY2, rcond=None)[0]
 
     B_hat_k = np.column_stack((beta1_k, beta2_k))
     B_hat_storage.append(B_hat_k)
@@ -319,86 +167,51 @@ def run_matrix_GAMP(n, p, p1, sigma, X, Y, B_bar_mean, B_bar_cov,
                                     B_hat_0, B_hat_0_row_mean, B_hat_0_row_cov, num_iter):
 
   delta = n / p
+  Sigma_0 = generate_Sigma_0(delta, B_bar_mean, B_bar_cov, B_hat_0_row_mean, B_hat_0_row_cov)
 
-  # Matrix-GAMP initializations
-  R_hat_minus_1 = np.zeros((n,2))
-  F_0 = np.eye(2)
+  channel = MLRChannel(np.array([p1, 1 - p1]), sigma)
+  prior = GaussianPrior(B_bar_mean, B_bar_cov)
 
-  Sigma_0 = generate_Sigma_0(delta, B_bar_mean, B_bar_cov, B_hat_0_row_mean, B_hat_0_row_cov)
-  print('Sigma_0\n',Sigma_0)
+  B_hat_storage, M_k_B_storage = MatrixGAMP(channel, prior).run(X, Y, B_hat_0, Sigma_0, num_iter)
 
-  # Storage of GAMP variables from previous iteration
-  Theta_k = np.zeros((n,2))
-  R_hat_k_minus_1 = R_hat_minus_1
-  B_hat_k = B_hat_0
-  F_k = F_0
+  return [B_hat_storage, M_k_B_storage]
 
-  # State evolution parameters
-  M_k_B = np.zeros((2,2))
-  T_k_B = M_k_B
-  Sigma_k = Sigma_0
 
-  # Storage of the estimate B_hat
-  B_hat_storage = []
-  B_hat_storage.append(B_hat_0)
+def run_trial(p, n, p1, sigma, num_iter, run_num, dtype=np.float64):
+  # One run for one n. Returns what the loops in compare_algo_multi_delta need from it.
+  print('=== Run number: ' + str(run_num + 1) + ' ===')
 
-  # Storage of the state evolution param M_k_B
-  M_k_B_storage = []
+  np.random.seed(run_num) # so that result is reproducible
 
-  for k in range(num_iter):
-    print("=== Running iteration: " + str(k+1) + " ===")
-    
-    # Computing Theta_k
-    Theta_k = np.dot(X, B_hat_k) - np.dot(R_hat_k_minus_1, F_k.T)
-
-    # Computing R_hat_k
-    Theta_k_and_Y = np.concatenate((Theta_k,Y[:,None]), axis=1)
-    R_hat_k = np.apply_along_axis(g_k_bayes_wrapper, 1, Theta_k_and_Y, Sigma_k, p1, sigma)
-
-    if (np.isnan(R_hat_k).any()):
-      print('=== EARLY STOPPAGE ===')
-      break
-    
-    # Computing C_k
-    C_k = compute_C_k(Theta_k, R_hat_k, Sigma_k)
-    
-    # Computing B_k_plus_1
-    B_k_plus_1 = np.dot(X.T, R_hat_k) - np.dot(B_hat_k, C_k.T)
-
-    # Computing state evolution for the (k+1)th iteration
-    M_k_plus_1_B = np.dot(R_hat_k.T, R_hat_k) / n
-    T_k_plus_1_B = M_k_plus_1_B
-    
-    # Computing B_hat_k_plus_1
-    B_hat_k_plus_1 = np.apply_along_axis(f_k_bayes, 1, B_k_plus_1, M_k_plus_1_B, T_k_plus_1_B, B_bar_mean, B_bar_cov)
-
-    # Computing F_k_plus_1
-    F_k_plus_1 = (p / n) * f_k_prime(M_k_plus_1_B, T_k_plus_1_B, B_bar_cov)
-
-    # Computing state evolution for the (k+1)th iteration
-    Sigma_k_plus_1 = np.zeros((4,4))
-    Sigma_k_plus_1[0:2,0:2] = Sigma_k[0:2,0:2]
-    temp_matrix = np.dot(B_hat_k_plus_1.T, B_hat_k_plus_1) / p
-    Sigma_k_plus_1[0:2,2:4] = temp_matrix / delta
-    Sigma_k_plus_1[2:4,0:2] = temp_matrix / delta
-    Sigma_k_plus_1[2:4,2:4] = temp_matrix / delta
-
-    # Updating parameters and storing B_hat_k_plus_1 & M_k_plus_1_B
-    B_hat_storage.append(B_hat_k_plus_1)
-    R_hat_k_minus_1 = R_hat_k
-    B_hat_k = B_hat_k_plus_1
-    F_k = F_k_plus_1
-    M_k_B_storage.append(M_k_plus_1_B)
-    M_k_B = M_k_plus_1_B
-    T_k_B = T_k_plus_1_B
-    Sigma_k = Sigma_k_plus_1
-
-    print('M_k_B\n',M_k_B) # Under bayes-optimal setting, M_k_B = T_k_B
-    print('Sigma_k:\n',Sigma_k)
+  B_bar_mean = np.array([0, 0])
+  B_bar_cov = np.eye(2)
+  B = multivariate_normal(B_bar_mean, B_bar_cov, p)
 
-  return [B_hat_storage, M_k_B_storage]
+  B_hat_0_row_mean = np.array([0, 0])
+  B_hat_0_row_cov = np.eye(2)
+  B_hat_0 = multivariate_normal(B_hat_0_row_mean, B_hat_0_row_cov, p)
+
+  X = gaussian_X(n, p, dtype)
+  Theta = np.dot(X, cast_like(X, B))
+
+  # Generating Y: We used ome numpy operational trick to avoid writing 
+  # a for loop (inefficient) to compute Y.
+  c = binomial(1, p1, n)
+  eps = normal(0, sigma, n)
+  c = c[:, None]
+  Y = (Theta * np.c_[c, 1-c]).sum(1) + eps
+
+  grid_param = 0.1
+  B_hat_spec = spec_init_grid_search(Y, X, n, p, grid_param)
+  B_hat_storage_EM = run_EM(n, p, p1, sigma, X, Y, B_hat_0, 1) #iter one because we have checked that it stops improving after first iter.
+  B_hat_storage_AM = run_AM(n, p, p1, sigma, X, Y, B_hat_0, 1) #iter one because we have checked that it stops improving after first iter.
+  B_hat_storage_GAMP = run_matrix_GAMP(n, p, p1, sigma, X, Y, B_bar_mean, B_bar_cov, 
+                                B_hat_0, B_hat_0_row_mean, B_hat_0_row_cov, num_iter)[0]
 
-def compare_algo_multi_delta(p, n_list, p1, sigma, num_iter, num_runs):
+  return B, B_hat_spec, B_hat_storage_EM, B_hat_storage_AM, B_hat_storage_GAMP
+
+
+def compare_algo_multi_delta(p, n_list, p1, sigma, num_iter, num_runs, num_workers=1, checkpoint_dir=None, dtype=np.float64):
   
   num_deltas = len(n_list)
 
@@ -422,39 +235,15 @@ def compare_algo_multi_delta(p, n_list, p1, sigma, num_iter, num_runs):
   var_corr1_list_GAMP = np.zeros((num_runs, num_deltas))
   var_corr2_list_GAMP = np.zeros((num_runs, num_deltas))
 
+  args_list = [(p, n, p1, sigma, num_iter, run_num, dtype) for n in n_list for run_num in range(num_runs)]
+  trials = iter(run_sweep(run_trial, args_list, num_workers, checkpoint_dir=checkpoint_dir))
+
   for n_index in range(len(n_list)):
     n = n_list[n_index]
     final_corr1 = 0
     final_corr2 = 0
     for run_num in range(num_runs):
-      print('=== Run number: ' + str(run_num + 1) + ' ===')
-
-      np.random.seed(run_num) # so that result is reproducible
-
-      B_bar_mean = np.array([0, 0])
-      B_bar_cov = np.eye(2)
-      B = multivariate_normal(B_bar_mean, B_bar_cov, p)
-
-      B_hat_0_row_mean = np.array([0, 0])
-      B_hat_0_row_cov = np.eye(2)
-      B_hat_0 = multivariate_normal(B_hat_0_row_mean, B_hat_0_row_cov, p)
-
-      X = normal(0, np.sqrt(1/n), (n, p))
-      Theta = np.dot(X, B)
-
-      # Generating Y: We used ome numpy operational trick to avoid writing 
-      # a for loop (inefficient) to compute Y.
-      c = binomial(1, p1, n)
-      eps = normal(0, sigma, n)
-      c = c[:, None]
-      Y = (Theta * np.c_[c, 1-c]).sum(1) + eps
-
-      grid_param = 0.1
-      B_hat_spec = spec_init_grid_search(Y, X, n, p, grid_param)
-      B_hat_storage_EM = run_EM(n, p, p1, sigma, X, Y, B_hat_0, 1) #iter one because we have checked that it stops improving after first iter.
-      B_hat_storage_AM = run_AM(n, p, p1, sigma, X, Y, B_hat_0, 1) #iter one because we have checked that it stops improving after first iter.
-      B_hat_storage_GAMP = run_matrix_GAMP(n, p, p1, sigma, X, Y, B_bar_mean, B_bar_cov, 
-                                    B_hat_0, B_hat_0_row_mean, B_hat_0_row_cov, num_iter)[0]
+      B, B_hat_spec, B_hat_storage_EM, B_hat_storage_AM, B_hat_storage_GAMP = next(trials)
 
       beta1 = B[:, 0]
       beta2 = B[:, 1]
@@ -541,12 +330,15 @@ def compare_algo_multi_delta(p, n_list, p1, sigma, num_iter, num_runs):
 
   return [Spec_output_list, EM_output_list, AM_output_list, GAMP_output_list]
 
-p = 500
-n_list = [int(1*p), int(1.5*p), int(2*p), int(2.5*p), int(3*p), int(3.5*p), int(4*p), int(4.5*p), int(5*p)]
-p1 = 0.6
-sigma = 0
-num_iter = 10
-num_runs = 10
-
-output_list = compare_algo_multi_delta(p, n_list, p1, sigma, num_iter, num_runs)
-save('output_list_gau_zero_mean', np.array(output_list))
\ No newline at end of file
+if __name__ == '__main__':
+  p = 500
+  n_list = [int(1*p), int(1.5*p), int(2*p), int(2.5*p), int(3*p), int(3.5*p), int(4*p), int(4.5*p), int(5*p)]
+  p1 = 0.6
+  sigma = 0
+  num_iter = 10
+  num_runs = 10
+  num_workers = os.cpu_count()
+  dtype = np.float64 # np.float32 halves the memory of X, check it with precision_report
+
+  output_list = compare_algo_multi_delta(p, n_list, p1, sigma, num_iter, num_runs, num_workers, os.path.join('checkpoints', 'output_list_gau_zero_mean'), dtype=dtype)
+  save('output_list_gau_zero_mean', np.array(output_list))
\ No newline at end of file
@@ -0,0 +1,46 @@
+import numpy as np
+from numpy import save
+
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from matrix_gamp import mismatched_MLR_corr
+
+'''
+What (run)corr_v_delta.py simulates, predicted by the mismatched SE instead: the
+final SE norm sq corr of both signals when the data come from p1 but GAMP assumes
+est_p1, on a whole (p1, est_p1, delta) grid. Entry [i, j, k] of each saved array goes with
+p1_list[i], est_p1_list[j] and delta_list[k], and the diagonal est_p1 = p1 is the
+correctly specified case.
+'''
+
+def get_SE_surface(p1_list, est_p1_list, delta_list, sigma, num_iter, num_points=16):
+  B_bar_mean = np.array([0, 0])
+  B_bar_cov = np.eye(2)
+  B_hat_0_row_mean = np.array([0, 0])
+  B_hat_0_row_cov = np.eye(2)
+
+  # All grid points go through the SE together.
+  p1, est_p1, delta = [x.ravel() for x in np.meshgrid(p1_list, est_p1_list, delta_list, indexing='ij')]
+  corrs = mismatched_MLR_corr(p1, est_p1, delta, B_bar_mean, B_bar_cov, B_hat_0_row_mean, B_hat_0_row_cov, sigma, num_iter, num_points)
+  shape = (len(p1_list), len(est_p1_list), len(delta_list))
+  return corrs[:, 0].reshape(shape), corrs[:, 1].reshape(shape)
+
+if __name__ == '__main__':
+  sigma = 0
+  num_iter = 10
+
+  p1_list = np.linspace(0.5, 0.9, 21)
+  est_p1_list = np.linspace(0.5, 0.9, 21)
+  delta_list = np.linspace(0.5, 5, 10)
+
+  start = time.time()
+  corr1_surface, corr2_surface = get_SE_surface(p1_list, est_p1_list, delta_list, sigma, num_iter)
+  print(str(corr1_surface.size) + ' points in ' + str(time.time() - start) + ' s')
+
+  save('SE_surface_corr1', corr1_surface)
+  save('SE_surface_corr2', corr2_surface)
+  save('SE_surface_p1_list', p1_list)
+  save('SE_surface_est_p1_list', est_p1_list)
+  save('SE_surface_delta_list', delta_list)
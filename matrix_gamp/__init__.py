@@ -0,0 +1,17 @@
+'''
+Matrix-GAMP for mixed regression, shared by the experiment scripts in the numbered
+folders. The scripts add the repository root to sys.path and import from here.
+'''
+
+from .state import generate_Sigma_0, SigmaK, E_Z_given_Zk, compute_C_k
+from .channels import MLRChannel, MaxAffineChannel, MOEChannel
+from .priors import GaussianPrior, SparsePrior, SoftThreshold, SE_norm_sq_corr
+from .engine import MatrixGAMP
+from .metrics import norm_sq_corr, MSE, get_SD
+from .sweep import run_sweep
+from .results import ResultsStore, gamp_iteration_columns
+from .design import is_out_of_core, row_blocks, cast_like, gaussian_X, gaussian_design
+from .design import DesignOperator, ImplicitGaussian, SubsampledDCT, random_X, design_dot
+from .precision import final_norm_sq_corrs, precision_report
+from .se import gauss_hermite_normal, state_evolution, se_fixed_point, SE_norm_sq_corr_and_MSE, MC_norm_sq_corr
+from .phase import MLR_M_k_batch, sparse_MLR_min_corr, mismatched_MLR_corr, phase_diagram
@@ -0,0 +1,266 @@
+import numpy as np
+from numpy.random import multivariate_normal
+
+from scipy.stats import norm
+
+from .state import SigmaK, E_Z_given_Zk
+from .se import gauss_hermite_normal
+
+'''
+Output denoisers g_k. Each channel turns Sigma_k into a SigmaK once per iteration
+(factorize) and then maps the n x L matrix Theta^k and the length-n vector Y to
+R_hat^k in one call (g_k), i.e. all n rows are denoised at once.
+'''
+
+def g_k_from_posterior_mean(E_Z_given_Zk_Ybar_out, Z_k, Sigma_k_state):
+  # g_k = Var(Z|Z_k)^+ (E[Z|Z_k,Y_bar] - E[Z|Z_k]), the same for every model.
+  vec3 = E_Z_given_Zk(Sigma_k_state, Z_k)
+  return np.dot(E_Z_given_Zk_Ybar_out - vec3, Sigma_k_state.Var_Z_given_Zk_inv.T)
+
+def se_nodes(Sigma_k_state, sigma, num_points):
+  # Gauss-Hermite nodes and weights for (Z, Z_k, eps) with (Z, Z_k) ~ N(0, Sigma_k)
+  # and independent noise eps ~ N(0, sigma^2), for the se_M_k of channels whose
+  # Y_bar is not Gaussian given Z. Returns Z, Z_k, eps and the weights. Directions
+  # of zero variance get no nodes, e.g. eps when sigma = 0.
+  L = Sigma_k_state.L
+  cov = np.zeros((2*L+1, 2*L+1))
+  cov[:2*L, :2*L] = Sigma_k_state.Sigma_k
+  cov[2*L, 2*L] = sigma**2
+  nodes, weights = gauss_hermite_normal(cov, num_points)
+  return nodes[:, :L], nodes[:, L:2*L], nodes[:, 2*L], weights
+
+''' === Mixed linear regression with L signals === '''
+
+def E_Z_given_Zk_Ybar_MLR(Z_k, Y_bar, Sigma_k_state, alpha_vec):
+  # Y_bar comes from signal l with probability alpha_vec[l], for any number L of signals.
+
+  # Each row of Zk_Ybar is one (Z_k, Y_bar) pair.
+  Zk_Ybar = np.column_stack((Z_k, Y_bar))
+  L = Sigma_k_state.L
+
+  # n x L log-weights log alpha_l + log p(Z_k, Y_bar | l), normalized per row with the
+  # log-sum-exp trick so that rows far in the tails do not end up as 0/0.
+  log_weights = np.log(alpha_vec) + np.column_stack([Sigma_k_state.logpdf_Y(l, Zk_Ybar) for l in range(L)])
+  log_weights -= np.max(log_weights, axis=1, keepdims=True)
+  weights = np.exp(log_weights)
+  weights /= np.sum(weights, axis=1, keepdims=True)
+
+  # E[Z|Z_k,Y_bar,l] for every row and every l, as an n x L x L tensor.
+  E_Z_given_Zk_Ybar_cbar = np.einsum('ij,lmj->ilm', Zk_Ybar, np.array(Sigma_k_state.coef_Y))
+  output = np.einsum('il,ilm->im', weights, E_Z_given_Zk_Ybar_cbar)
+
+  return output
+
+class MLRChannel:
+  '''
+  Y_i = <X_i, beta_l> + eps_i with l drawn from alpha_vec and eps_i ~ N(0, sigma^2).
+  The denoiser uses alpha_vec, which need not be the proportions the data came from.
+  '''
+
+  def __init__(self, alpha_vec, sigma):
+    self.alpha_vec = np.asarray(alpha_vec, dtype=float)
+    self.sigma = sigma
+
+  def factorize(self, Sigma_k):
+    return SigmaK(Sigma_k, self.sigma)
+
+  def g_k(self, Theta_k, Y, Sigma_k_state):
+    vec2 = E_Z_given_Zk_Ybar_MLR(Theta_k, Y, Sigma_k_state, self.alpha_vec)
+    return g_k_from_posterior_mean(vec2, Theta_k, Sigma_k_state)
+
+  def se_M_k(self, Sigma_k_state, num_points):
+    # M_{k+1}^B = E[g_k g_k^T]. Given that Y_bar comes from signal l, (Z_k, Y_bar)
+    # is N(0, cov_Y[l]), so the expectation is a Gauss-Hermite rule per signal.
+    L = Sigma_k_state.L
+    M_k_B = np.zeros((L, L))
+    for l in range(L):
+      nodes, weights = gauss_hermite_normal(Sigma_k_state.cov_Y[l], num_points)
+      g = self.g_k(nodes[:, :L], nodes[:, L], Sigma_k_state)
+      M_k_B += self.alpha_vec[l] * np.dot(g.T * weights, g)
+    return M_k_B
+
+''' === Max-affine regression, E[Z|Z^k,bar{Y}] by importance sampling === '''
+
+def pdf_Y_bar_given_Z_max_affine(Z, Y_bar, sigma, c1, c2):
+  # Z carries (Z1, Z2) in its last axis, e.g. an n x S x 2 tensor of samples, and
+  # Y_bar broadcasts against Z1.
+
+  Z1 = Z[..., 0]
+  Z2 = Z[..., 1]
+  first_is_max = Z1 + c1 > Z2 + c2
+  if sigma == 0:
+    indicator = (Y_bar == Z1 + c1).astype(float)
+    return np.where(first_is_max, indicator, 1 - indicator)
+  elif sigma > 0:
+    return np.where(first_is_max, norm.pdf((Y_bar - Z1 - c1) / sigma), norm.pdf((Y_bar - Z2 - c2) / sigma))
+
+def E_Z_given_Zk_Ybar_max_affine(Z_k, Y_bar, Sigma_k_state, c1, c2, sigma, rng=None):
+  # NOTE: c1, c2 are the intercepts of max-affine reg.
+  # Each of the n rows gets num_samples draws of Z|Z_k, weighted by p(Y_bar|Z).
+  # The factor p(Z_k) is the same for all draws of a row, so it cancels. The draws
+  # come from np.random unless a Generator rng is given, which draws through the
+  # Cholesky factor so that they move continuously with Sigma_k.
+
+  n = len(Z_k)
+  mean_Z_given_Zk = E_Z_given_Zk(Sigma_k_state, Z_k)
+  cov_Z_given_Zk = Sigma_k_state.Var_Z_given_Zk
+  num_samples = 100
+  if rng is None:
+    Z_samples = mean_Z_given_Zk[:, None, :] + multivariate_normal(np.array([0,0]), cov_Z_given_Zk, (n, num_samples))
+  else:
+    Z_samples = mean_Z_given_Zk[:, None, :] + rng.multivariate_normal(np.array([0,0]), cov_Z_given_Zk, (n, num_samples), method='cholesky')
+
+  p_Ybar_given_Z_Zk = pdf_Y_bar_given_Z_max_affine(Z_samples, Y_bar[:, None], sigma, c1, c2)
+  numerator = np.sum(Z_samples * p_Ybar_given_Z_Zk[:, :, None], axis=1)
+  denominator = np.sum(p_Ybar_given_Z_Zk, axis=1)
+
+  output = numerator / denominator[:, None]
+
+  return output
+
+def E_Z_given_Ybar_max_affine(Y_bar, Sigma_k_state, c1, c2, sigma, rng=None, cache=None):
+  # This function is for EM-AMP.
+  # NOTE: c1, c2 are the intercepts of max-affine reg.
+  # Returns E[Z|Y_bar] for each of the n entries of Y_bar, from an n x num_samples
+  # bank of draws from N(0, Sigma_11) taken from rng (np.random if None). A run
+  # passes its own rng, so that the runs of a sweep do not share draws, and its own
+  # cache (a dict), which keeps the last bank and the last result so that the
+  # outer iterations of EM-GAMP do not redraw and reweigh the same samples.
+  if cache is None:
+    cache = {}
+
+  n = len(Y_bar)
+  Sigma_11 = Sigma_k_state.Sigma_11
+  bank_key = (Sigma_11.tobytes(), n)
+  key = bank_key + (c1, c2, sigma, Y_bar.tobytes())
+  if cache.get('key') == key:
+    return cache['output']
+
+  if cache.get('bank_key') != bank_key:
+    num_samples = 100
+    if rng is None:
+      cache['bank'] = multivariate_normal(np.array([0,0]), Sigma_11, (n, num_samples))
+    else:
+      cache['bank'] = rng.multivariate_normal(np.array([0,0]), Sigma_11, (n, num_samples))
+    cache['bank_key'] = bank_key
+  Z_samples = cache['bank']
+
+  p_Ybar_given_Z = pdf_Y_bar_given_Z_max_affine(Z_samples, Y_bar[:, None], sigma, c1, c2)
+  numerator = np.sum(Z_samples * p_Ybar_given_Z[:, :, None], axis=1)
+  denominator = np.sum(p_Ybar_given_Z, axis=1)
+
+  output = numerator / denominator[:, None]
+  cache['key'] = key
+  cache['output'] = output
+
+  return output
+
+class MaxAffineChannel:
+  '''
+  Y_i = max(<X_i, beta_1> + c1, <X_i, beta_2> + c2) + eps_i with eps_i ~ N(0, sigma^2).
+  '''
+
+  def __init__(self, c1, c2, sigma):
+    self.c1 = c1
+    self.c2 = c2
+    self.sigma = sigma
+
+  def factorize(self, Sigma_k):
+    return SigmaK(Sigma_k)
+
+  def g_k(self, Theta_k, Y, Sigma_k_state):
+    vec2 = E_Z_given_Zk_Ybar_max_affine(Theta_k, Y, Sigma_k_state, self.c1, self.c2, self.sigma)
+    return g_k_from_posterior_mean(vec2, Theta_k, Sigma_k_state)
+
+  def se_M_k(self, Sigma_k_state, num_points, seed=0):
+    # M_{k+1}^B = E[g_k g_k^T] with Gauss-Hermite over (Z, Z_k, eps). g_k is itself
+    # importance sampled, so its draws come from a Generator seeded with seed, which
+    # makes the map from Sigma_k to M_k_B deterministic.
+    Z, Z_k, eps, weights = se_nodes(Sigma_k_state, self.sigma, num_points)
+    Y = np.maximum(Z[:, 0] + self.c1, Z[:, 1] + self.c2) + eps
+    vec2 = E_Z_given_Zk_Ybar_max_affine(Z_k, Y, Sigma_k_state, self.c1, self.c2, self.sigma, np.random.default_rng(seed))
+    g = g_k_from_posterior_mean(vec2, Z_k, Sigma_k_state)
+    return np.dot(g.T * weights, g)
+
+''' === Mixture of two experts with a softmax gate === '''
+
+def log_pdf_Y_bar_given_Z_MOE(Z, Y_bar, sigma):
+  # Note: function requires sigma > 0.
+  # Z carries (Z1, Z2, Z3, Z4) in its last axis, e.g. an n x S x 4 tensor of samples,
+  # and Y_bar broadcasts against Z1. Everything stays in log-space, so large gating
+  # logits or far-off samples do not overflow or underflow.
+
+  Z1 = Z[..., 0]
+  Z2 = Z[..., 1]
+  Z3 = Z[..., 2]
+  Z4 = Z[..., 3]
+
+  # log of the softmax gate exp(Z3) / (exp(Z3) + exp(Z4)) and of its complement.
+  log_prob = -np.logaddexp(0, Z4 - Z3)
+  log_1_minus_prob = -np.logaddexp(0, Z3 - Z4)
+  output = np.logaddexp(log_prob + norm.logpdf((Y_bar-Z1)/sigma), log_1_minus_prob + norm.logpdf((Y_bar-Z2)/sigma))
+
+  return output
+
+def E_Z_given_Zk_Ybar_MOE(Z_k, Y_bar, Sigma_k_state, sigma, chunk_size=2000, rng=None):
+  # Each of the n rows gets num_samples draws of Z|Z_k, weighted by p(Y_bar|Z).
+  # The factor p(Z_k) is the same for all draws of a row, so it cancels. Rows are
+  # processed chunk_size at a time, which bounds the sample tensor to
+  # chunk_size x num_samples x 4. The draws come from np.random unless a Generator
+  # rng is given, which draws through the Cholesky factor as for max-affine.
+
+  n = len(Z_k)
+  mean_Z_given_Zk = E_Z_given_Zk(Sigma_k_state, Z_k)
+  cov_Z_given_Zk = Sigma_k_state.Var_Z_given_Zk
+  num_samples = 200
+
+  output = np.zeros((n, 4))
+  for start in range(0, n, chunk_size):
+    end = min(start + chunk_size, n)
+    if rng is None:
+      Z_samples = mean_Z_given_Zk[start:end, None, :] + multivariate_normal(np.zeros(4), cov_Z_given_Zk, (end - start, num_samples))
+    else:
+      Z_samples = mean_Z_given_Zk[start:end, None, :] + rng.multivariate_normal(np.zeros(4), cov_Z_given_Zk, (end - start, num_samples), method='cholesky')
+
+    # Importance weights normalized per row with the log-sum-exp trick.
+    log_weights = log_pdf_Y_bar_given_Z_MOE(Z_samples, Y_bar[start:end, None], sigma)
+    log_weights -= np.max(log_weights, axis=1, keepdims=True)
+    weights = np.exp(log_weights)
+    weights /= np.sum(weights, axis=1, keepdims=True)
+
+    output[start:end] = np.sum(Z_samples * weights[:, :, None], axis=1)
+
+  return output
+
+class MOEChannel:
+  '''
+  Y_i = <X_i, beta_1> + eps_i with probability exp(<X_i, gate_1>) / (exp(<X_i, gate_1>)
+  + exp(<X_i, gate_2>)) and <X_i, beta_2> + eps_i otherwise, so B = [beta_1, beta_2,
+  gate_1, gate_2].
+  '''
+
+  def __init__(self, sigma, chunk_size=2000):
+    self.sigma = sigma
+    self.chunk_size = chunk_size
+
+  def factorize(self, Sigma_k):
+    return SigmaK(Sigma_k)
+
+  def g_k(self, Theta_k, Y, Sigma_k_state):
+    vec2 = E_Z_given_Zk_Ybar_MOE(Theta_k, Y, Sigma_k_state, self.sigma, self.chunk_size)
+    return g_k_from_posterior_mean(vec2, Theta_k, Sigma_k_state)
+
+  def se_M_k(self, Sigma_k_state, num_points, seed=0):
+    # M_{k+1}^B = E[g_k g_k^T] with Gauss-Hermite over (Z, Z_k, eps), as for
+    # MaxAffineChannel, and the expert exactly: Y_bar = Z1 + eps with the gate
+    # probability and Z2 + eps otherwise. (Z, Z_k, eps) has up to 9 dimensions, so
+    # keep num_points small (3 or 4).
+    Z, Z_k, eps, weights = se_nodes(Sigma_k_state, self.sigma, num_points)
+    prob = np.exp(-np.logaddexp(0, Z[:, 3] - Z[:, 2]))
+    rng = np.random.default_rng(seed)
+    M_k_B = np.zeros((4, 4))
+    for expert_prob, Y in [(prob, Z[:, 0] + eps), (1 - prob, Z[:, 1] + eps)]:
+      vec2 = E_Z_given_Zk_Ybar_MOE(Z_k, Y, Sigma_k_state, self.sigma, self.chunk_size, rng)
+      g = g_k_from_posterior_mean(vec2, Z_k, Sigma_k_state)
+      M_k_B += np.dot(g.T * (weights * expert_prob), g)
+    return M_k_B
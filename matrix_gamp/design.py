@@ -0,0 +1,199 @@
+import numpy as np
+from numpy.random import normal, randint, Generator, Philox
+
+from scipy.fft import dct, idct
+
+'''
+Sensing matrices that do not fit in memory. X can be kept on disk as a .npy file
+and opened with np.load(path, mmap_mode='r'); GAMP and the baselines then read it
+block_rows rows at a time instead of loading it whole. An X held in memory is read
+as a single block, which is the same computation as before.
+
+X can also be float32, which halves its memory. Products with X are then done in
+float32 (see cast_like) and everything else, i.e. Theta_k, R_hat_k, B_hat_k, the
+L x L state evolution matrices and the metrics, stays in float64.
+
+Finally, X need not be stored at all. A DesignOperator is an n x p matrix that only
+gives out blocks of its rows and the products X B and X^T R: ImplicitGaussian
+regenerates its rows from a seed whenever they are read, and SubsampledDCT is a
+randomly sign-flipped, subsampled DCT whose products take O(N log N) time. Either
+one takes O(n + p) memory, so p can run into the millions.
+'''
+
+# Without an explicit block_rows, a block of a memory-mapped X takes about this
+# many bytes.
+BLOCK_BYTES = 2**26
+
+def is_out_of_core(X):
+  return isinstance(X, (np.memmap, DesignOperator))
+
+def get_block_rows(X, block_rows=None):
+  # Rows run along the last axis but one, so a stack of R matrices (R x n x p)
+  # is read block_rows rows of every matrix at a time.
+  if block_rows is not None:
+    return block_rows
+  if not is_out_of_core(X):
+    return X.shape[-2]
+  row_bytes = X.itemsize * X.shape[-1] * int(np.prod(X.shape[:-2]))
+  return max(1, BLOCK_BYTES // row_bytes)
+
+def row_blocks(X, block_rows=None):
+  # (start, end) of consecutive row blocks that together cover the n rows of X.
+  n = X.shape[-2]
+  block_rows = get_block_rows(X, block_rows)
+  for start in range(0, n, block_rows):
+    yield start, min(start + block_rows, n)
+
+def cast_like(X, A):
+  # A in the dtype of X, so that a product of a float32 X with a float64 A is done
+  # in float32 rather than by copying X to float64. A itself if X is float64.
+  return np.asarray(A).astype(X.dtype, copy=False)
+
+def fill_gaussian(X, block_rows=None):
+  # Fills X with iid N(0, 1/n) entries. The blocks are drawn in row order from
+  # np.random, so with the same seed this is normal(0, np.sqrt(1/n), (n, p)),
+  # rounded to the dtype of X, and a float32 X is never held in float64 as a whole.
+  n, p = X.shape
+  if block_rows is None:
+    block_rows = max(1, BLOCK_BYTES // (8 * p))
+  for start, end in row_blocks(X, block_rows):
+    X[start:end] = normal(0, np.sqrt(1/n), (end - start, p))
+  return X
+
+def gaussian_X(n, p, dtype=np.float64):
+  # The data generation of the run scripts, normal(0, np.sqrt(1/n), (n, p)), in dtype.
+  if dtype == np.float64:
+    return normal(0, np.sqrt(1/n), (n, p))
+  return fill_gaussian(np.empty((n, p), dtype=dtype))
+
+def gaussian_design(path, n, p, block_rows=None, dtype=np.float64):
+  # The same X written to path block by block and opened as a memory map.
+  X = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(n, p))
+  fill_gaussian(X, block_rows)
+  X.flush()
+  del X
+  return np.load(path, mmap_mode='r')
+
+''' === Sensing matrices that are never held in memory === '''
+
+class DesignOperator:
+  '''
+  An n x p matrix known only through rows(start, end), the dense block of rows
+  start to end, which X[start:end] also gives. That is all GAMP and the EM/AM
+  baselines read, one block at a time. dot and T_dot give X B and X^T R by a pass
+  over the rows; fast_products is set by operators that override them with
+  something faster, and GAMP then uses those instead of reading rows.
+  '''
+
+  fast_products = False
+
+  def __init__(self, n, p, dtype=np.float64):
+    self.shape = (n, p)
+    self.dtype = np.dtype(dtype)
+    self.itemsize = self.dtype.itemsize
+
+  def __len__(self):
+    return self.shape[0]
+
+  def __getitem__(self, index):
+    if not isinstance(index, slice) or index.step not in (None, 1):
+      raise TypeError('only blocks of consecutive rows, X[start:end], can be read')
+    start, end, _ = index.indices(self.shape[0])
+    return self.rows(start, max(start, end))
+
+  def rows(self, start, end):
+    raise NotImplementedError
+
+  def dot(self, B):
+    B = cast_like(self, B)
+    output = np.zeros((self.shape[0],) + B.shape[1:], dtype=self.dtype)
+    for start, end in row_blocks(self):
+      output[start:end] = np.dot(self.rows(start, end), B)
+    return output
+
+  def T_dot(self, R):
+    R = cast_like(self, R)
+    output = np.zeros((self.shape[1],) + R.shape[1:], dtype=self.dtype)
+    for start, end in row_blocks(self):
+      output += np.dot(self.rows(start, end).T, R[start:end])
+    return output
+
+class ImplicitGaussian(DesignOperator):
+  '''
+  X with iid N(0, 1/n) entries, where row i is drawn from its own Philox stream,
+  the one of counter i under key seed. Any block of rows is redrawn on demand, so
+  X is the same matrix however it is split into blocks, and it is never stored.
+  Every read of X costs drawing those n x p normals again.
+  '''
+
+  def __init__(self, n, p, seed, dtype=np.float64):
+    DesignOperator.__init__(self, n, p, dtype)
+    self.seed = seed
+
+  def rows(self, start, end):
+    n, p = self.shape
+    block = np.empty((end - start, p), dtype=self.dtype)
+    for i in range(start, end):
+      rng = Generator(Philox(key=self.seed, counter=i << 128))
+      rng.standard_normal(p, dtype=self.dtype, out=block[i - start])
+    block *= np.sqrt(1/n)
+    return block
+
+class SubsampledDCT(DesignOperator):
+  '''
+  A structured stand-in for a Gaussian X: the signs of the p columns are flipped
+  at random, the result is zero-padded to N = max(n, p), transformed by the
+  orthonormal N-point DCT and n of the N outputs are kept at random. Scaled by
+  sqrt(N/n), its entries have variance 1/n like the Gaussian X, but its columns
+  (n >= p) or rows (n <= p) are exactly orthogonal, so how closely GAMP follows
+  the state evolution has to be checked against a Gaussian X. X B and X^T R take
+  O(L N log N) time.
+  '''
+
+  fast_products = True
+
+  def __init__(self, n, p, seed, dtype=np.float64):
+    DesignOperator.__init__(self, n, p, dtype)
+    self.seed = seed
+    self.N = max(n, p)
+    rng = Generator(Philox(key=seed))
+    self.signs = rng.choice(np.array([-1, 1], dtype=self.dtype), p)
+    self.freqs = np.sort(rng.choice(self.N, n, replace=False))
+    self.scale = float(np.sqrt(self.N / n))
+
+  def rows(self, start, end):
+    # Entry (k, j) of the orthonormal DCT-II, for the kept frequencies k.
+    N, p = self.N, self.shape[1]
+    k = self.freqs[start:end, None]
+    j = np.arange(p)[None, :]
+    block = np.sqrt(2/N) * np.cos(np.pi * (2*j + 1) * k / (2*N))
+    block[k[:, 0] == 0] /= np.sqrt(2)
+    return (self.scale * block * self.signs).astype(self.dtype, copy=False)
+
+  def dot(self, B):
+    B = cast_like(self, B)
+    padded = np.zeros((self.N,) + B.shape[1:], dtype=self.dtype)
+    padded[:self.shape[1]] = B * self.signs.reshape((-1,) + (1,) * (B.ndim - 1))
+    return self.scale * dct(padded, type=2, norm='ortho', axis=0)[self.freqs]
+
+  def T_dot(self, R):
+    R = cast_like(self, R)
+    padded = np.zeros((self.N,) + R.shape[1:], dtype=self.dtype)
+    padded[self.freqs] = R
+    output = idct(padded, type=2, norm='ortho', axis=0)[:self.shape[1]]
+    return self.scale * output * self.signs.reshape((-1,) + (1,) * (R.ndim - 1))
+
+DESIGNS = {'implicit': ImplicitGaussian, 'dct': SubsampledDCT}
+
+def random_X(n, p, dtype=np.float64, design='gaussian'):
+  # X for the run scripts: the dense Gaussian X of gaussian_X, or one of the
+  # operators in DESIGNS with its seed drawn from np.random.
+  if design == 'gaussian':
+    return gaussian_X(n, p, dtype)
+  return DESIGNS[design](n, p, randint(2**31), dtype)
+
+def design_dot(X, B):
+  # X B for a dense X, a memory map or a DesignOperator alike.
+  if isinstance(X, DesignOperator):
+    return X.dot(B)
+  return np.dot(X, cast_like(X, B))
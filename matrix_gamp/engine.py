@@ -0,0 +1,303 @@
+import numpy as np
+
+from .state import compute_C_k
+from .metrics import norm_sq_corr
+from .design import is_out_of_core, row_blocks, cast_like, DesignOperator
+
+class MatrixGAMP:
+  '''
+  The matrix-GAMP iteration, shared by every model. The model only enters through
+  the two denoisers:
+
+  - channel: factorize(Sigma_k) -> Sigma_k_state and g_k(Theta_k, Y, Sigma_k_state) -> R_hat_k,
+    see channels.py.
+  - prior: f_k(B_k_plus_1, M_k_B, T_k_B) -> (B_hat_k_plus_1, mean Jacobian of f_k),
+    see priors.py.
+
+  If the true signal B is given, the iteration also stops as soon as the smallest
+  normalized squared correlation over the L columns stops improving.
+
+  run() does one trial; run_batch() does R trials of the same size together, which
+  is what the sweeps over num_runs seeds use.
+
+  X is only touched in one pass over its rows per iteration, which gives both
+  Theta_k = X B_hat_k - ... and X^T R_hat_k, so X can be a memory map of a matrix
+  that does not fit in memory (see design.py). It is then read block_rows rows at
+  a time; an X in memory is one block unless block_rows is given. A float32 X is
+  multiplied in float32, while the rest of the iteration stays in float64.
+
+  run() also takes a DesignOperator for X, which is read like a memory map, or,
+  if it has fast products (e.g. SubsampledDCT), only through X B_hat_k and
+  X^T R_hat_k. run_batch() takes arrays only.
+  '''
+
+  def __init__(self, channel, prior, B=None, block_rows=None):
+    self.channel = channel
+    self.prior = prior
+    self.B = B
+    self.block_rows = block_rows
+
+  def run(self, X, Y, B_hat_0, Sigma_0, num_iter):
+    n, p = X.shape
+    L = B_hat_0.shape[1]
+    delta = n / p
+
+    print('Sigma_0\n',Sigma_0)
+
+    # Theta_k, R_hat_k and B_k_plus_1 are written in place every iteration.
+    Theta_k = np.zeros((n,L))
+    B_k_plus_1 = np.zeros((p,L))
+
+    # Matrix-GAMP initializations
+    R_hat_k_minus_1 = np.zeros((n,L))
+    B_hat_k = B_hat_0
+    F_k = np.eye(L)
+    Sigma_k = Sigma_0
+
+    # Storage of the estimate B_hat
+    B_hat_storage = []
+    B_hat_storage.append(B_hat_0)
+
+    # Storage of the state evolution param M_k_B
+    M_k_B_storage = []
+
+    prev_min_corr = 0
+    for k in range(num_iter):
+      print("=== Running iteration: " + str(k+1) + " ===")
+
+      # Factorizing Sigma_k once for this iteration
+      Sigma_k_state = self.channel.factorize(Sigma_k)
+
+      if not Sigma_k_state.is_pos_semi_def:
+        print('the input matrix must be positive semidefinite')
+        print('=== EARLY STOPPAGE ===')
+        break
+
+      # Computing Theta_k, R_hat_k and X^T R_hat_k in one pass over X
+      R_hat_k = np.zeros((n,L))
+      if not self._row_pass(X, Y, B_hat_k, R_hat_k_minus_1, F_k, Sigma_k_state, Theta_k, R_hat_k, B_k_plus_1):
+        print('=== EARLY STOPPAGE ===')
+        break
+
+      # Computing C_k
+      C_k = compute_C_k(Theta_k, R_hat_k, Sigma_k_state)
+
+      # Computing B_k_plus_1
+      B_k_plus_1 -= np.dot(B_hat_k, C_k.T)
+
+      # Computing state evolution for the (k+1)th iteration
+      M_k_plus_1_B = np.dot(R_hat_k.T, R_hat_k) / n
+      T_k_plus_1_B = M_k_plus_1_B
+
+      # Computing B_hat_k_plus_1
+      B_hat_k_plus_1, f_k_prime_mean = self.prior.f_k(B_k_plus_1, M_k_plus_1_B, T_k_plus_1_B)
+
+      if (np.isnan(B_hat_k_plus_1).any()):
+        print('=== EARLY STOPPAGE ===')
+        break
+
+      # Computing F_k_plus_1
+      F_k_plus_1 = p * f_k_prime_mean / n
+
+      # Computing state evolution for the (k+1)th iteration
+      Sigma_k_plus_1 = np.zeros((2*L,2*L))
+      Sigma_k_plus_1[:L,:L] = Sigma_k[:L,:L]
+      temp_matrix = np.dot(B_hat_k_plus_1.T, B_hat_k_plus_1) / p
+      Sigma_k_plus_1[:L,L:] = temp_matrix / delta
+      Sigma_k_plus_1[L:,:L] = temp_matrix / delta
+      Sigma_k_plus_1[L:,L:] = temp_matrix / delta
+
+      if (np.isnan(Sigma_k_plus_1).any()):
+        print('=== EARLY STOPPAGE ===')
+        break
+
+      # deciding termination of algorithm
+      if self.B is not None:
+        current_min_corr = min(norm_sq_corr(self.B[:, l], B_hat_k_plus_1[:, l]) for l in range(L))
+        if (prev_min_corr >= current_min_corr):
+          print('=== EARLY STOPPAGE ===')
+          break
+        else:
+          prev_min_corr = current_min_corr
+
+      # Updating parameters and storing B_hat_k_plus_1 & M_k_plus_1_B
+      B_hat_storage.append(B_hat_k_plus_1)
+      R_hat_k_minus_1 = R_hat_k
+      B_hat_k = B_hat_k_plus_1
+      F_k = F_k_plus_1
+      M_k_B_storage.append(M_k_plus_1_B)
+      Sigma_k = Sigma_k_plus_1
+
+      print('M_k_B\n',M_k_plus_1_B)
+      print('Sigma_k:\n',Sigma_k)
+
+    return B_hat_storage, M_k_B_storage
+
+  def _row_pass(self, X, Y, B_hat_k, R_hat_k_minus_1, F_k, Sigma_k_state, Theta_k, R_hat_k, B_k_plus_1):
+    # Fills Theta_k and R_hat_k one block of rows at a time and sums X^T R_hat_k
+    # into B_k_plus_1 along the way, so every block of X is read once. This works
+    # because g_k denoises every row on its own. Returns False once R_hat_k has a nan.
+    if isinstance(X, DesignOperator) and X.fast_products:
+      return self._product_pass(X, Y, B_hat_k, R_hat_k_minus_1, F_k, Sigma_k_state, Theta_k, R_hat_k, B_k_plus_1)
+
+    B_hat_k_X = cast_like(X, B_hat_k)
+    for start, end in row_blocks(X, self.block_rows):
+      X_block = X[start:end]
+      Theta_k[start:end] = np.dot(X_block, B_hat_k_X)
+      Theta_k[start:end] -= np.dot(R_hat_k_minus_1[start:end], F_k.T)
+      R_hat_k[start:end] = self.channel.g_k(Theta_k[start:end], Y[start:end], Sigma_k_state)
+
+      if (np.isnan(R_hat_k[start:end]).any()):
+        return False
+
+      XT_R_hat_k = np.dot(X_block.T, cast_like(X, R_hat_k[start:end]))
+      if start == 0:
+        B_k_plus_1[:] = XT_R_hat_k
+      else:
+        B_k_plus_1 += XT_R_hat_k
+    return True
+
+  def _product_pass(self, X, Y, B_hat_k, R_hat_k_minus_1, F_k, Sigma_k_state, Theta_k, R_hat_k, B_k_plus_1):
+    # The same for an X whose products are cheaper than reading its rows: one call
+    # for X B_hat_k, g_k on all n rows, then one call for X^T R_hat_k.
+    Theta_k[:] = X.dot(B_hat_k)
+    Theta_k -= np.dot(R_hat_k_minus_1, F_k.T)
+    R_hat_k[:] = self.channel.g_k(Theta_k, Y, Sigma_k_state)
+
+    if (np.isnan(R_hat_k).any()):
+      return False
+
+    B_k_plus_1[:] = X.T_dot(R_hat_k)
+    return True
+
+  def run_batch(self, X, Y, B_hat_0, Sigma_0, num_iter):
+    # R independent trials advanced in lockstep: X is R x n x p, Y is R x n and
+    # B_hat_0 is R x p x L (and B, if given, R x p x L). The products with X are
+    # done for all trials at once; the denoisers see one trial at a time since
+    # every trial has its own Sigma_k. A trial that would hit an early stoppage
+    # in run() is dropped from the stack instead, so each trial returns exactly
+    # what run() returns for it. A memory-mapped X stays whole on disk and only
+    # the rows of the trials still running are read.
+    R, n, p = X.shape
+    L = B_hat_0.shape[2]
+    delta = n / p
+
+    print('Sigma_0\n',Sigma_0)
+
+    # Matrix-GAMP initializations, one slice per trial still running.
+    trials = np.arange(R)
+    R_hat_k_minus_1 = np.zeros((R,n,L))
+    B_hat_k = B_hat_0
+    F_k = np.tile(np.eye(L), (R,1,1))
+    Sigma_k = np.tile(Sigma_0, (R,1,1))
+
+    # Storage of the estimate B_hat and the state evolution param M_k_B, per trial
+    B_hat_storage = [[B_hat_0[r]] for r in range(R)]
+    M_k_B_storage = [[] for r in range(R)]
+
+    prev_min_corr = np.zeros(R)
+    for k in range(num_iter):
+      if len(trials) == 0:
+        break
+      print("=== Running iteration: " + str(k+1) + " (" + str(len(trials)) + " trials) ===")
+
+      # Factorizing Sigma_k of every trial
+      Sigma_k_states = []
+      keep = np.ones(len(trials), dtype=bool)
+      for i in range(len(trials)):
+        Sigma_k_states.append(self.channel.factorize(Sigma_k[i]))
+        if not Sigma_k_states[i].is_pos_semi_def:
+          print('the input matrix must be positive semidefinite')
+          keep[i] = False
+
+      # Computing Theta_k, R_hat_k and X^T R_hat_k in one pass over X
+      Theta_k = np.zeros((len(trials),n,L))
+      R_hat_k = np.zeros((len(trials),n,L))
+      B_k_plus_1 = np.zeros((len(trials),p,L))
+      self._row_pass_batch(X, Y, trials, B_hat_k, R_hat_k_minus_1, F_k, Sigma_k_states, keep, Theta_k, R_hat_k, B_k_plus_1)
+
+      # Computing C_k trial by trial
+      C_k = np.zeros((len(trials),L,L))
+      for i in np.flatnonzero(keep):
+        C_k[i] = compute_C_k(Theta_k[i], R_hat_k[i], Sigma_k_states[i])
+
+      trials, X, Y, B_hat_k, Sigma_k, prev_min_corr, R_hat_k, C_k, B_k_plus_1 = _drop_stopped(
+        keep, trials, X, Y, B_hat_k, Sigma_k, prev_min_corr, R_hat_k, C_k, B_k_plus_1)
+
+      # Computing B_k_plus_1
+      B_k_plus_1 -= np.matmul(B_hat_k, C_k.transpose(0,2,1))
+
+      # Computing state evolution for the (k+1)th iteration
+      M_k_plus_1_B = np.matmul(R_hat_k.transpose(0,2,1), R_hat_k) / n
+      T_k_plus_1_B = M_k_plus_1_B
+
+      # Computing B_hat_k_plus_1 trial by trial
+      B_hat_k_plus_1 = np.zeros_like(B_k_plus_1)
+      f_k_prime_mean = np.zeros((len(trials),L,L))
+      for i in range(len(trials)):
+        B_hat_k_plus_1[i], f_k_prime_mean[i] = self.prior.f_k(B_k_plus_1[i], M_k_plus_1_B[i], T_k_plus_1_B[i])
+
+      # Computing F_k_plus_1
+      F_k_plus_1 = p * f_k_prime_mean / n
+
+      # Computing state evolution for the (k+1)th iteration
+      Sigma_k_plus_1 = np.zeros((len(trials),2*L,2*L))
+      Sigma_k_plus_1[:,:L,:L] = Sigma_k[:,:L,:L]
+      temp_matrix = np.matmul(B_hat_k_plus_1.transpose(0,2,1), B_hat_k_plus_1) / p
+      Sigma_k_plus_1[:,:L,L:] = temp_matrix / delta
+      Sigma_k_plus_1[:,L:,:L] = temp_matrix / delta
+      Sigma_k_plus_1[:,L:,L:] = temp_matrix / delta
+
+      keep = ~(np.isnan(B_hat_k_plus_1).any(axis=(1,2)) | np.isnan(Sigma_k_plus_1).any(axis=(1,2)))
+
+      # deciding termination of algorithm
+      if self.B is not None:
+        for i in np.flatnonzero(keep):
+          B = self.B[trials[i]]
+          current_min_corr = min(norm_sq_corr(B[:, l], B_hat_k_plus_1[i, :, l]) for l in range(L))
+          if (prev_min_corr[i] >= current_min_corr):
+            keep[i] = False
+          else:
+            prev_min_corr[i] = current_min_corr
+
+      trials, X, Y, B_hat_k_plus_1, Sigma_k_plus_1, prev_min_corr, R_hat_k, F_k_plus_1, M_k_plus_1_B = _drop_stopped(
+        keep, trials, X, Y, B_hat_k_plus_1, Sigma_k_plus_1, prev_min_corr, R_hat_k, F_k_plus_1, M_k_plus_1_B)
+
+      # Updating parameters and storing B_hat_k_plus_1 & M_k_plus_1_B
+      for i in range(len(trials)):
+        B_hat_storage[trials[i]].append(B_hat_k_plus_1[i])
+        M_k_B_storage[trials[i]].append(M_k_plus_1_B[i])
+      R_hat_k_minus_1 = R_hat_k
+      B_hat_k = B_hat_k_plus_1
+      F_k = F_k_plus_1
+      Sigma_k = Sigma_k_plus_1
+
+    return B_hat_storage, M_k_B_storage
+
+  def _row_pass_batch(self, X, Y, trials, B_hat_k, R_hat_k_minus_1, F_k, Sigma_k_states, keep, Theta_k, R_hat_k, B_k_plus_1):
+    # run_batch's version of _row_pass: a block holds the same rows of every trial.
+    # A trial whose Sigma_k is not PSD, or whose R_hat_k gets a nan, has keep set to
+    # False and is not denoised any further.
+    B_hat_k_X = cast_like(X, B_hat_k)
+    for start, end in row_blocks(X, self.block_rows):
+      X_block = X[:, start:end]
+      if len(X_block) != len(trials):
+        X_block = X_block[trials]
+      Theta_k[:, start:end] = np.matmul(X_block, B_hat_k_X)
+      Theta_k[:, start:end] -= np.matmul(R_hat_k_minus_1[:, start:end], F_k.transpose(0,2,1))
+
+      for i in np.flatnonzero(keep):
+        R_hat_k[i, start:end] = self.channel.g_k(Theta_k[i, start:end], Y[i, start:end], Sigma_k_states[i])
+        if (np.isnan(R_hat_k[i, start:end]).any()):
+          keep[i] = False
+
+      B_k_plus_1 += np.matmul(X_block.transpose(0,2,1), cast_like(X, R_hat_k[:, start:end]))
+
+def _drop_stopped(keep, *stacks):
+  # Keeps the slices of the trials that carry on, copying only when one has stopped.
+  # A memory-mapped X is left as it is, see _row_pass_batch.
+  if keep.all():
+    return stacks
+  for r in np.flatnonzero(~keep):
+    print('=== EARLY STOPPAGE (trial ' + str(stacks[0][r] + 1) + ') ===')
+  return tuple(stack if is_out_of_core(stack) else stack[keep] for stack in stacks)
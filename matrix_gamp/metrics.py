@@ -0,0 +1,31 @@
+import numpy as np
+from numpy import linalg
+
+def norm_sq_corr(beta, beta_hat):
+  num = np.square(np.dot(beta, beta_hat))
+  denom = np.square(linalg.norm(beta)) * np.square(linalg.norm(beta_hat))
+  if num == 0:
+    return 0
+  else:
+    return num / denom
+
+def MSE(beta, beta_hat):
+  output = np.mean(np.square(beta - beta_hat))
+  return output
+
+def get_SD(var_corr_list, mean_corr_list, succ_run_list):
+
+  num_iter = len(mean_corr_list)
+  num_runs = len(var_corr_list)
+
+  SD_list = np.zeros(num_iter)
+  for iter in range(num_iter):
+    var = 0
+    for run in range(num_runs):
+      corr = var_corr_list[run][iter]
+      if corr > 0:
+        var += (corr - mean_corr_list[iter])**2
+    var = var / succ_run_list[iter]
+    SD_list[iter] = np.sqrt(var)
+
+  return SD_list
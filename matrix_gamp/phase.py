@@ -0,0 +1,297 @@
+import numpy as np
+from numpy import linalg
+
+from .se import hermite_grid
+from .state import generate_Sigma_0
+from .priors import f_k_bayes_moments, f_k_bayes_sparse_moments
+
+'''
+The SE of mixed linear regression over grids of parameters. The state evolution
+of state_evolution() is run for many grid points at once, as stacks of Sigma_k and
+M_k_B: (eps, delta, p1) for the sparse prior, whose phase_diagram() only evaluates
+the points of a dense (eps, delta) grid near where the min corr changes, filling in
+the rest, and (p1, est_p1, delta) for the Gaussian prior with a denoiser that
+assumes the wrong proportions.
+'''
+
+def MLR_M_k_batch(Sigma_k, alpha_vec, sigma, num_points=16, chunk_nodes=2**21):
+  # MLRChannel.se_M_k for a stack of K Sigma_k (K x 2L x 2L), each with its own
+  # alpha_vec (K x L). The blocks and densities that SigmaK sets up for one Sigma_k
+  # are set up here for all of them at once. Also returns whether every covariance
+  # of (Z_k, Y_bar) is PSD, per Sigma_k. The points are taken in chunks of at most
+  # chunk_nodes nodes of the Gauss-Hermite rule.
+  M_k_B, _, is_pos_semi_def = _MLR_M_k_T_k_batch(Sigma_k, alpha_vec, sigma, num_points, chunk_nodes)
+  return M_k_B, is_pos_semi_def
+
+def mismatched_MLR_M_k_batch(Sigma_k, data_Sigma_k, alpha_vec, data_alpha_vec, sigma, num_points=16, chunk_nodes=2**21):
+  # The same when g_k is mismatched: g_k is built from Sigma_k and alpha_vec, what
+  # GAMP believes, while (Z, Z_k) ~ N(0, data_Sigma_k) and Y_bar comes from signal l
+  # with probability data_alpha_vec[l]. Then M_{k+1}^B = E[d g_k / d Z], which by
+  # Stein's lemma is E[g_k (Z - E[Z|Z_k])^T] Var(Z|Z_k)^+ under data_Sigma_k, and
+  # T_{k+1}^B = E[g_k g_k^T] no longer equals it. Returns M_k_B, T_k_B and whether
+  # the covariances of Sigma_k are PSD.
+  return _MLR_M_k_T_k_batch(Sigma_k, alpha_vec, sigma, num_points, chunk_nodes, data_Sigma_k, data_alpha_vec)
+
+def _MLR_M_k_T_k_batch(Sigma_k, alpha_vec, sigma, num_points, chunk_nodes, data_Sigma_k=None, data_alpha_vec=None):
+  K = len(Sigma_k)
+  L = Sigma_k.shape[1] // 2
+  grid, weights = hermite_grid(L+1, num_points)
+  chunk_size = max(1, chunk_nodes // len(grid))
+
+  M_k_B = np.zeros((K, L, L))
+  T_k_B = np.zeros((K, L, L))
+  is_pos_semi_def = np.ones(K, dtype=bool)
+  for start in range(0, K, chunk_size):
+    end = min(start + chunk_size, K)
+    data = None if data_Sigma_k is None else (data_Sigma_k[start:end], data_alpha_vec[start:end])
+    M_k_B[start:end], T_k_B[start:end], is_pos_semi_def[start:end] = _MLR_M_k_chunk(Sigma_k[start:end], alpha_vec[start:end], sigma, grid, weights, data)
+  return M_k_B, T_k_B, is_pos_semi_def
+
+def _MLR_blocks(Sigma_k, sigma):
+  # What SigmaK keeps for every Sigma_k of a stack: the coefficients of E[Z|Z_k],
+  # Var(Z|Z_k)^+ and, given signal l, the coefficients of E[Z|Z_k,Y_bar] and the
+  # whitening and factor of the covariance of (Z_k, Y_bar), with the eigenvalue
+  # cut-off of SigmaK.
+  L = Sigma_k.shape[1] // 2
+  Sigma_11 = Sigma_k[:, :L, :L]
+  Sigma_12 = Sigma_k[:, :L, L:]
+  Sigma_21 = Sigma_k[:, L:, :L]
+  Sigma_22 = Sigma_k[:, L:, L:]
+
+  coef = np.matmul(Sigma_12, linalg.pinv(Sigma_22))
+  Var_Z_given_Zk_inv = linalg.pinv(Sigma_11 - np.matmul(coef, Sigma_21))
+
+  coef_Y = []
+  whiten_Y = []
+  log_norm_Y = []
+  factor_Y = []
+  is_pos_semi_def = np.ones(len(Sigma_k), dtype=bool)
+  for l in range(L):
+    cov = np.zeros((len(Sigma_k), L+1, L+1))
+    cov[:, :L, :L] = Sigma_22
+    cov[:, :L, L] = Sigma_k[:, L:, l]
+    cov[:, L, :L] = Sigma_k[:, l, L:]
+    cov[:, L, L] = Sigma_k[:, l, l] + sigma**2
+    coef_Y.append(np.matmul(np.concatenate((Sigma_12, Sigma_k[:, :L, l, None]), axis=2), linalg.pinv(cov)))
+
+    s, u = np.linalg.eigh(cov)
+    eps = 1E6 * np.finfo(float).eps * np.max(np.abs(s), axis=1, keepdims=True)
+    is_pos_semi_def &= ~(np.min(s, axis=1) < -eps[:, 0])
+    keep = s > eps
+    s_keep = np.where(keep, s, 1)
+    whiten_Y.append(np.where(keep[:, None, :], u / np.sqrt(s_keep)[:, None, :], 0))
+    log_norm_Y.append(-0.5 * (np.sum(keep, axis=1) * np.log(2 * np.pi) + np.sum(np.log(s_keep), axis=1)))
+    factor_Y.append(u * np.sqrt(np.maximum(s, 0))[:, None, :])
+
+  return coef, Var_Z_given_Zk_inv, coef_Y, whiten_Y, log_norm_Y, factor_Y, is_pos_semi_def
+
+def _MLR_M_k_chunk(Sigma_k, alpha_vec, sigma, grid, weights, data=None):
+  # M_k_B, T_k_B and the PSD flags of _MLR_M_k_T_k_batch for one chunk. data is
+  # None or (data_Sigma_k, data_alpha_vec).
+  L = Sigma_k.shape[1] // 2
+  coef, Var_Z_given_Zk_inv, coef_Y, whiten_Y, log_norm_Y, factor_Y, is_pos_semi_def = _MLR_blocks(Sigma_k, sigma)
+  if data is None:
+    data_alpha_vec = alpha_vec
+    data_coef, data_Var_Z_given_Zk_inv, data_coef_Y, data_factor_Y = coef, Var_Z_given_Zk_inv, coef_Y, factor_Y
+  else:
+    data_Sigma_k, data_alpha_vec = data
+    data_coef, data_Var_Z_given_Zk_inv, data_coef_Y, _, _, data_factor_Y, _ = _MLR_blocks(data_Sigma_k, sigma)
+
+  T_k_B = np.zeros((len(Sigma_k), L, L))
+  E_g_Z = np.zeros((len(Sigma_k), L, L))
+  for l in range(L):
+    # (Z_k, Y_bar) at the nodes of the rule for its law given signal l, K x G x (L+1).
+    nodes = np.matmul(grid, data_factor_Y[l].transpose(0,2,1))
+    Z_k = nodes[:, :, :L]
+
+    log_weights = np.log(alpha_vec)[:, None, :] + np.stack([log_norm_Y[m][:, None] - 0.5 * np.sum(np.square(np.matmul(nodes, whiten_Y[m])), axis=2)
+                                                            for m in range(L)], axis=2)
+    log_weights -= np.max(log_weights, axis=2, keepdims=True)
+    post = np.exp(log_weights)
+    post /= np.sum(post, axis=2, keepdims=True)
+
+    E_Z_given_Zk_Ybar = sum(post[:, :, m, None] * np.matmul(nodes, coef_Y[m].transpose(0,2,1)) for m in range(L))
+    g = np.matmul(E_Z_given_Zk_Ybar - np.matmul(Z_k, coef.transpose(0,2,1)), Var_Z_given_Zk_inv.transpose(0,2,1))
+    T_k_B += data_alpha_vec[:, l, None, None] * np.matmul(g.transpose(0,2,1) * weights, g)
+    if data is not None:
+      # Z - E[Z|Z_k] enters through its mean given (Z_k, Y_bar) and signal l.
+      Z_residual = np.matmul(nodes, data_coef_Y[l].transpose(0,2,1)) - np.matmul(Z_k, data_coef.transpose(0,2,1))
+      E_g_Z += data_alpha_vec[:, l, None, None] * np.matmul(g.transpose(0,2,1) * weights, Z_residual)
+
+  if data is None:
+    return T_k_B, T_k_B, is_pos_semi_def
+  return np.matmul(E_g_Z, data_Var_Z_given_Zk_inv), T_k_B, is_pos_semi_def
+
+def _MLR_state_evolution(Sigma_k, alpha_vec, sigma, delta, E_B_B, se_moments, num_iter, num_points, data_alpha_vec=None):
+  # The SE recursion of state_evolution() for K points at once, each with its own
+  # Sigma_0 (K x 2L x 2L), proportions, delta and E[B_bar B_bar^T] (K x L x L).
+  # se_moments(M_k_B, T_k_B, data_M_k_B, index) gives the moments of the prior at
+  # the points index, where data_M_k_B is None unless the channel is mismatched.
+  # Each point stops like state_evolution() does. Returns the norm sq corrs of
+  # every point (K x L) after its last iteration.
+  #
+  # With data_alpha_vec, g_k assumes alpha_vec while the data come from
+  # data_alpha_vec. GAMP then still believes Sigma_k has all three blocks equal to
+  # E[f_k f_k^T] / delta, while in fact (Z, Z_k) has E[B_bar f_k^T] / delta off the
+  # diagonal, so the recursion carries both: Sigma_k for g_k and data_Sigma_k for
+  # the expectations.
+  K, L = alpha_vec.shape
+  Sigma_k = Sigma_k.copy()
+  data_Sigma_k = Sigma_k.copy()
+  corrs = np.zeros((K, L))
+  min_corr = np.zeros(K)
+  running = np.arange(K)
+  for k in range(num_iter):
+    if len(running) == 0:
+      break
+    if data_alpha_vec is None:
+      M_k_B, is_pos_semi_def = MLR_M_k_batch(Sigma_k[running], alpha_vec[running], sigma, num_points)
+      E_B_f, E_f_f = se_moments(M_k_B, M_k_B, None, running)
+    else:
+      data_M_k_B, T_k_B, is_pos_semi_def = mismatched_MLR_M_k_batch(Sigma_k[running], data_Sigma_k[running], alpha_vec[running],
+                                                                     data_alpha_vec[running], sigma, num_points)
+      # GAMP estimates M_{k+1}^B and T_{k+1}^B both by R_hat_k^T R_hat_k / n, i.e. T_k_B.
+      E_B_f, E_f_f = se_moments(T_k_B, T_k_B, data_M_k_B, running)
+    # A point where f_k is 0 has corr 0/0, which counts as no improvement.
+    with np.errstate(invalid='ignore'):
+      current_corrs = np.square(np.diagonal(E_B_f, axis1=1, axis2=2)) / (np.diagonal(E_B_B[running], axis1=1, axis2=2) * np.diagonal(E_f_f, axis1=1, axis2=2))
+    current_min_corr = np.min(current_corrs, axis=1)
+
+    improved = is_pos_semi_def & (current_min_corr > min_corr[running])
+    running = running[improved]
+    min_corr[running] = current_min_corr[improved]
+    corrs[running] = current_corrs[improved]
+    Sigma_k[running, :L, L:] = E_f_f[improved] / delta[running, None, None]
+    Sigma_k[running, L:, :L] = Sigma_k[running, :L, L:]
+    Sigma_k[running, L:, L:] = Sigma_k[running, :L, L:]
+    if data_alpha_vec is not None:
+      data_Sigma_k[running, :L, L:] = E_B_f[improved] / delta[running, None, None]
+      data_Sigma_k[running, L:, :L] = data_Sigma_k[running, :L, L:].transpose(0,2,1)
+      data_Sigma_k[running, L:, L:] = Sigma_k[running, L:, L:]
+
+  return corrs
+
+def sparse_MLR_min_corr(eps, delta, p1, alpha, sigma, num_iter, num_points=16):
+  # The SE of matrix-GAMP with the Bayes denoiser for 2 signals with the sparse
+  # prior of eps (the same for both signals) and alpha, with GAMP initialized from
+  # the prior, for K grid points (eps, delta, p1) at once. Returns the min over the
+  # signals of the final norm sq corr of every point, the value the heatmaps of
+  # folder 3 show.
+  eps = np.asarray(eps, dtype=float)
+  delta = np.asarray(delta, dtype=float)
+  p1 = np.asarray(p1, dtype=float)
+  K = len(eps)
+
+  eps_vec = np.stack((eps, eps), axis=1)
+  B_bar_mean = eps_vec * alpha
+  E_B_B = np.zeros((K, 2, 2))
+  E_B_B[:, [0, 1], [0, 1]] = eps_vec - np.square(B_bar_mean)
+  E_B_B += B_bar_mean[:, :, None] * B_bar_mean[:, None, :]
+  alpha_vec = np.stack((p1, 1 - p1), axis=1)
+
+  # Sigma_0 of generate_Sigma_0 for B_hat_0 drawn from the prior.
+  Sigma_0 = np.zeros((K, 4, 4))
+  Sigma_0[:, :2, :2] = E_B_B
+  Sigma_0[:, :2, 2:] = B_bar_mean[:, :, None] * B_bar_mean[:, None, :]
+  Sigma_0[:, 2:, :2] = Sigma_0[:, :2, 2:]
+  Sigma_0[:, 2:, 2:] = E_B_B
+  Sigma_0 /= delta[:, None, None]
+
+  def se_moments(M_k_B, T_k_B, data_M_k_B, index):
+    return f_k_bayes_sparse_moments(M_k_B, T_k_B, eps_vec[index], alpha, num_points)
+
+  corrs = _MLR_state_evolution(Sigma_0, alpha_vec, sigma, delta, E_B_B, se_moments, num_iter, num_points)
+  return np.min(corrs, axis=1)
+
+def mismatched_MLR_corr(p1, est_p1, delta, B_bar_mean, B_bar_cov, B_hat_0_row_mean, B_hat_0_row_cov, sigma, num_iter, num_points=16):
+  # The SE of matrix-GAMP for 2 signals with the Gaussian prior when the data come
+  # from proportions (p1, 1 - p1) but the denoiser g_k assumes (est_p1, 1 - est_p1),
+  # as in folder 5, for K grid points (p1, est_p1, delta) at once. B^{k+1} then has
+  # M_{k+1}^B = E[d g_k / d Z] under p1, while f_k is given R_hat_k^T R_hat_k / n for
+  # both M_{k+1}^B and T_{k+1}^B, as in GAMP (see mismatched_MLR_M_k_batch). GAMP's
+  # Onsager term C_k is only exact for est_p1 = p1, so under a mismatch this is an
+  # approximation: iteration by iteration within about 0.03 of GAMP at p = 1000 for
+  # est_p1 down to 0.5 with p1 = 0.7, but the SE can find Sigma_k not PSD and stop
+  # a few iterations before GAMP does. Returns the final norm sq corr of both
+  # signals of every point (K x 2).
+  p1 = np.asarray(p1, dtype=float)
+  est_p1 = np.asarray(est_p1, dtype=float)
+  delta = np.asarray(delta, dtype=float)
+  B_bar_mean = np.asarray(B_bar_mean, dtype=float)
+  K = len(p1)
+
+  E_B_B = np.tile(B_bar_cov + np.outer(B_bar_mean, B_bar_mean), (K, 1, 1))
+  data_alpha_vec = np.stack((p1, 1 - p1), axis=1)
+  alpha_vec = np.stack((est_p1, 1 - est_p1), axis=1)
+  Sigma_0 = generate_Sigma_0(1, B_bar_mean, B_bar_cov, B_hat_0_row_mean, B_hat_0_row_cov) / delta[:, None, None]
+
+  def se_moments(M_k_B, T_k_B, data_M_k_B, index):
+    return f_k_bayes_moments(M_k_B, T_k_B, B_bar_mean, B_bar_cov, data_M_k_B)
+
+  return _MLR_state_evolution(Sigma_0, alpha_vec, sigma, delta, E_B_B, se_moments, num_iter, num_points, data_alpha_vec)
+
+def phase_diagram(evaluate, eps_list, delta_list, coarse_step=16, tol=0.01):
+  # evaluate(eps, delta) gives the value of K points at once, e.g. a wrapper of
+  # sparse_MLR_min_corr. Returns it on the whole len(eps_list) x len(delta_list)
+  # grid, and which points were evaluated rather than interpolated.
+  #
+  # The points every coarse_step rows and columns are evaluated first, and the
+  # cells between them are refined like a quadtree: the centre and the midpoints of
+  # the edges of a cell are evaluated, and if they are all within tol of the
+  # bilinear interpolation from its corners the rest of the cell is interpolated,
+  # otherwise it is split in 4. So the evaluations gather where the value bends,
+  # i.e. along the transitions, and smooth regions cost a few points per cell.
+  num_eps = len(eps_list)
+  num_delta = len(delta_list)
+  eps_list = np.asarray(eps_list, dtype=float)
+  delta_list = np.asarray(delta_list, dtype=float)
+  values = np.full((num_eps, num_delta), np.nan)
+  evaluated = np.zeros((num_eps, num_delta), dtype=bool)
+
+  def lattice(num):
+    return np.union1d(np.arange(0, num, coarse_step), [num - 1])
+
+  def evaluate_at(i, j):
+    todo = ~evaluated[i, j]
+    i, j = i[todo], j[todo]
+    if len(i) > 0:
+      i, j = np.unique(np.stack((i, j)), axis=1)
+      values[i, j] = evaluate(eps_list[i], delta_list[j])
+      evaluated[i, j] = True
+
+  def bilinear(cell, i, j):
+    i0, i1, j0, j1 = cell
+    s = (i - i0) / max(i1 - i0, 1)
+    t = (j - j0) / max(j1 - j0, 1)
+    return ((1-s) * (1-t) * values[i0, j0] + (1-s) * t * values[i0, j1]
+            + s * (1-t) * values[i1, j0] + s * t * values[i1, j1])
+
+  rows, cols = lattice(num_eps), lattice(num_delta)
+  i, j = np.meshgrid(rows, cols, indexing='ij')
+  evaluate_at(i.ravel(), j.ravel())
+  cells = [(rows[a], rows[a+1], cols[b], cols[b+1]) for a in range(len(rows) - 1) for b in range(len(cols) - 1)]
+  print('=== ' + str(len(cells)) + ' cells: ' + str(np.sum(evaluated)) + ' points ===')
+
+  while cells:
+    # The centre and the midpoints of the edges of every cell (some coincide with
+    # corners once a side is 1 long).
+    mids = [((i0 + i1) // 2, (j0 + j1) // 2) for i0, i1, j0, j1 in cells]
+    probes = [np.array([[im, im, im, i0, i1], [jm, j0, j1, jm, jm]]) for (i0, i1, j0, j1), (im, jm) in zip(cells, mids)]
+    evaluate_at(np.concatenate([probe[0] for probe in probes]), np.concatenate([probe[1] for probe in probes]))
+
+    next_cells = []
+    for cell, (im, jm), probe in zip(cells, mids, probes):
+      i0, i1, j0, j1 = cell
+      if np.max(np.abs(values[probe[0], probe[1]] - bilinear(cell, probe[0], probe[1]))) <= tol:
+        i, j = np.meshgrid(np.arange(i0, i1 + 1), np.arange(j0, j1 + 1), indexing='ij')
+        todo = ~evaluated[i, j]
+        values[i[todo], j[todo]] = bilinear(cell, i[todo], j[todo])
+        continue
+      row_splits = [(i0, im), (im, i1)] if i1 - i0 > 1 else [(i0, i1)]
+      col_splits = [(j0, jm), (jm, j1)] if j1 - j0 > 1 else [(j0, j1)]
+      if len(row_splits) + len(col_splits) > 2:
+        next_cells += [(a0, a1, b0, b1) for a0, a1 in row_splits for b0, b1 in col_splits]
+    cells = next_cells
+    print('=== ' + str(len(cells)) + ' cells: ' + str(np.sum(evaluated)) + ' points ===')
+
+  return values, evaluated
@@ -0,0 +1,35 @@
+import numpy as np
+
+from .sweep import run_sweep
+from .metrics import norm_sq_corr
+
+'''
+Accuracy check of the float32 mode (see design.py). The same cells are run once
+with dtype=np.float64 and once with dtype=np.float32, from the same seeds, and the
+final normalized squared correlations are compared cell by cell.
+'''
+
+def final_norm_sq_corrs(B, B_hat_storage):
+  # The norm sq corr of every column of the last estimate, as the sweeps report it.
+  B_hat = B_hat_storage[-1]
+  return np.array([norm_sq_corr(B[:, l], B_hat[:, l]) for l in range(B.shape[1])])
+
+def precision_report(task, args_list, final_corrs, num_workers=1, tol=1e-3):
+  # task has to take dtype as a keyword argument, as the tasks of the run scripts
+  # do, and final_corrs picks the final norm sq corrs out of one of its outputs.
+  corrs = {}
+  for dtype in [np.float64, np.float32]:
+    outputs = run_sweep(task, args_list, num_workers, task_kwargs={'dtype': dtype})
+    corrs[dtype] = [np.ravel(final_corrs(output)) for output in outputs]
+
+  print('=== float32 vs float64: final norm sq corr ===')
+  max_abs_diff = np.zeros(len(args_list))
+  for i in range(len(args_list)):
+    max_abs_diff[i] = np.max(np.abs(corrs[np.float32][i] - corrs[np.float64][i]))
+    print('cell ' + str(i) + ': float64 ' + str(corrs[np.float64][i]) + ', float32 ' + str(corrs[np.float32][i])
+          + ', max abs diff ' + str(max_abs_diff[i]) + ('' if max_abs_diff[i] <= tol else ' <-- above ' + str(tol)))
+
+  passed = bool(np.all(max_abs_diff <= tol))
+  print('=== ' + ('PASSED' if passed else 'FAILED') + ': largest abs diff ' + str(np.max(max_abs_diff)) + ', tol ' + str(tol) + ' ===')
+
+  return {'float64': corrs[np.float64], 'float32': corrs[np.float32], 'max_abs_diff': max_abs_diff, 'passed': passed}
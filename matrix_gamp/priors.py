@@ -0,0 +1,276 @@
+import numpy as np
+from numpy import linalg
+
+from .se import hermite_grid, SE_norm_sq_corr_and_MSE
+
+'''
+Input denoisers f_k. Each prior maps the p x L matrix B^{k+1} to B_hat^{k+1} in one
+call (f_k) and also returns the Jacobian of f_k averaged over the p rows, from which
+GAMP forms the Onsager term F^{k+1}.
+'''
+
+''' === Gaussian prior B_bar ~ N(B_bar_mean, B_bar_cov) === '''
+
+def f_k_bayes(B_bar_k, M_k_B, T_k_B, B_bar_mean, B_bar_cov):
+
+  # B_bar_k is either one row of B^k or the whole p x L matrix; the gain is the
+  # same for every row, so the whole matrix is denoised with a single product.
+  part1 = linalg.pinv(np.dot(M_k_B, np.dot(B_bar_cov, M_k_B.T)) + T_k_B)
+  gain = np.dot(np.dot(B_bar_cov, M_k_B.T), part1)
+  part2 = B_bar_k - np.dot(M_k_B, B_bar_mean)
+  output = B_bar_mean + np.dot(part2, gain.T)
+
+  return output
+
+# This only holds for jointly Gaussian priors.
+def f_k_prime(M_k_B, T_k_B, B_bar_cov):
+  part1 = linalg.pinv(np.dot(M_k_B, np.dot(B_bar_cov, M_k_B.T)) + T_k_B)
+  output = np.dot(part1, np.dot(M_k_B, B_bar_cov))
+  return output
+
+def f_k_bayes_moments(M_k_B, T_k_B, B_bar_mean, B_bar_cov, data_M_k_B=None):
+  # E[B_bar f_k^T] and E[f_k f_k^T] for B_k = M_k_B B_bar + N(0, T_k_B), the
+  # input side of the state evolution. f_k is affine in B_k, so both are exact.
+  # M_k_B and T_k_B can also be stacks of matrices (... x L x L), which give
+  # stacks of moments. If data_M_k_B is given, B_k = data_M_k_B B_bar + N(0, T_k_B)
+  # while f_k still takes M_k_B, as when the channel denoiser is mismatched.
+  M_k_B_T = np.swapaxes(M_k_B, -1, -2)
+  cov_B_k = np.matmul(M_k_B, np.matmul(B_bar_cov, M_k_B_T)) + T_k_B
+  gain = np.matmul(np.matmul(B_bar_cov, M_k_B_T), linalg.pinv(cov_B_k))
+  gain_T = np.swapaxes(gain, -1, -2)
+  mean_mean = np.outer(B_bar_mean, B_bar_mean)
+  if data_M_k_B is None:
+    E_B_f = mean_mean + np.matmul(B_bar_cov, np.matmul(M_k_B_T, gain_T))
+    E_f_f = mean_mean + np.matmul(gain, np.matmul(cov_B_k, gain_T))
+    return E_B_f, E_f_f
+
+  # E[f_k] = B_bar_mean + gain (data_M_k_B - M_k_B) B_bar_mean.
+  data_M_k_B_T = np.swapaxes(data_M_k_B, -1, -2)
+  E_f = B_bar_mean + np.matmul(gain, np.matmul(data_M_k_B - M_k_B, B_bar_mean[:, None]))[..., 0]
+  E_f_T = E_f[..., None, :]
+  data_cov_B_k = np.matmul(data_M_k_B, np.matmul(B_bar_cov, data_M_k_B_T)) + T_k_B
+  E_B_f = B_bar_mean[:, None] * E_f_T + np.matmul(B_bar_cov, np.matmul(data_M_k_B_T, gain_T))
+  E_f_f = E_f[..., :, None] * E_f_T + np.matmul(gain, np.matmul(data_cov_B_k, gain_T))
+  return E_B_f, E_f_f
+
+class GaussianPrior:
+
+  def __init__(self, B_bar_mean, B_bar_cov):
+    self.B_bar_mean = B_bar_mean
+    self.B_bar_cov = B_bar_cov
+
+  def f_k(self, B_k_plus_1, M_k_B, T_k_B):
+    B_hat = f_k_bayes(B_k_plus_1, M_k_B, T_k_B, self.B_bar_mean, self.B_bar_cov)
+    return B_hat, f_k_prime(M_k_B, T_k_B, self.B_bar_cov)
+
+  def se_moments(self, M_k_B, T_k_B):
+    return f_k_bayes_moments(M_k_B, T_k_B, np.asarray(self.B_bar_mean, dtype=float), self.B_bar_cov)
+
+def SE_norm_sq_corr(M_k_B, B_bar_mean, B_bar_cov):
+  # The SE norm sq corr of every signal for the Gaussian prior, for one M_k_B or a
+  # stack of them (e.g. all iterations, runs and deltas of a sweep), one entry or
+  # one array over the stack per signal.
+  E_B_bar_sq = np.diag(B_bar_cov) + np.square(B_bar_mean)
+  corrs, _ = SE_norm_sq_corr_and_MSE(GaussianPrior(B_bar_mean, B_bar_cov), M_k_B, E_B_bar_sq)
+  return np.moveaxis(corrs, -1, 0)
+
+''' === Sparse prior, each entry of B_bar in {-1, 0, 1} === '''
+
+def sparse_pmf(beta, eps, alpha):
+  if beta == 1:
+    return (eps / 2) * (1 + alpha)
+  elif beta == -1:
+    return (eps / 2) * (1 - alpha)
+  elif beta == 0:
+    return 1 - eps
+  else:
+    return 0
+
+# Only holds for sparse prior w/ 3 point distribution. All p rows of B_bar_k are
+# weighed against the 9 atoms of {-1,0,1}^2 at once, which gives both the denoised
+# p x 2 matrix and the Jacobian of f_k averaged over the rows.
+def f_k_bayes_and_prime_sparse(B_bar_k, M_k_B, T_k_B, eps_vec, alpha):
+
+  eps1 = eps_vec[0]
+  eps2 = eps_vec[1]
+
+  atoms = np.array([[beta1, beta2] for beta1 in [-1, 0, 1] for beta2 in [-1, 0, 1]])
+  atoms_pmf = np.array([sparse_pmf(beta1, eps1, alpha) * sparse_pmf(beta2, eps2, alpha) for beta1, beta2 in atoms])
+  atoms = atoms[atoms_pmf > 0]
+  atoms_pmf = atoms_pmf[atoms_pmf > 0]
+
+  # p x 9 log-weights log P(b_bar) + log N(B_bar_k; M_k_B b_bar, T_k_B), up to a
+  # constant per row which the normalization removes.
+  T_k_B_inv = linalg.pinv(T_k_B)
+  diff = B_bar_k[:, None, :] - np.dot(atoms, M_k_B.T)[None, :, :]
+  log_weights = np.log(atoms_pmf) - 0.5 * np.sum(np.dot(diff, T_k_B_inv) * diff, axis=2)
+  log_weights -= np.max(log_weights, axis=1, keepdims=True)
+  weights = np.exp(log_weights)
+  weights /= np.sum(weights, axis=1, keepdims=True)
+
+  output = np.dot(weights, atoms)
+
+  # The Jacobian of row j is Cov(b_bar | B_bar_k_j) M_k_B^T T_k_B^+, so only the
+  # posterior covariance averaged over the rows is needed.
+  p = len(B_bar_k)
+  mean_post_cov = (np.dot(atoms.T * np.sum(weights, axis=0), atoms) - np.dot(output.T, output)) / p
+  output_prime = np.dot(mean_post_cov, np.dot(M_k_B.T, T_k_B_inv))
+
+  return output, output_prime
+
+def _sparse_se_nodes(M_k_B, T_k_B, eps_vec, alpha, num_points):
+  # The points over which the SE of a denoiser of B_k = M_k_B B_bar + G, G ~ N(0, T_k_B),
+  # is summed when B_bar has the sparse prior: every one of the 9 atoms of B_bar and
+  # every node of a Gauss-Hermite rule over G. M_k_B and T_k_B are K x 2 x 2 stacks
+  # and eps_vec is 2 or K x 2. Returns the atoms (A x 2), their P(b_bar) (K x A), the
+  # means M_k_B b_bar (K x A x 2), B_k (K x A x G x 2), the probability of every
+  # (atom, node) pair (K x A x G) and T_k_B^+ (K x 2 x 2).
+
+  # P(b_bar) of the 9 atoms for every matrix. An atom of probability 0 gets
+  # log-weight -inf and so no weight.
+  eps_vec = np.asarray(eps_vec, dtype=float).reshape(-1, 2)
+  atoms = np.array([[beta1, beta2] for beta1 in [-1, 0, 1] for beta2 in [-1, 0, 1]])
+  atoms_pmf = np.ones((len(eps_vec), len(atoms)))
+  for l in range(2):
+    eps = eps_vec[:, l:l+1]
+    beta = atoms[:, l]
+    atoms_pmf *= np.where(beta == 0, 1 - eps, (eps / 2) * (1 + alpha * beta))
+  atoms_pmf = np.broadcast_to(atoms_pmf, (len(M_k_B), len(atoms)))
+
+  # G = factor xi over the nodes xi of the rule for N(0, I_2), one factor per matrix,
+  # and T_k_B^+ from the same eigenvalues with the cut-off of SigmaK, so that a
+  # T_k_B of rank 1 (e.g. M_1 for a prior with mean 0) is not inverted along its
+  # rounding error.
+  s, u = np.linalg.eigh(T_k_B)
+  factor = u * np.sqrt(np.maximum(s, 0))[:, None, :]
+  keep = s > 1E6 * np.finfo(float).eps * np.max(np.abs(s), axis=1, keepdims=True)
+  T_k_B_inv = np.matmul(u * np.where(keep, 1 / np.where(keep, s, 1), 0)[:, None, :], u.transpose(0,2,1))
+  grid, weights = hermite_grid(2, num_points)
+  G = np.matmul(grid, factor.transpose(0,2,1))
+
+  means = np.einsum('kij,aj->kai', M_k_B, atoms)
+  B_k = means[:, :, None, :] + G[:, None, :, :]
+  prob = atoms_pmf[:, :, None] * weights
+  return atoms, atoms_pmf, means, B_k, prob, T_k_B_inv
+
+def _sparse_se_moments(atoms, B_k, prob, f):
+  # E[B_bar f_k^T] and E[f_k f_k^T] from f_k at every point of _sparse_se_nodes
+  # (K x A x G x 2).
+  K, num_atoms, num_nodes = prob.shape
+  prob = prob.reshape(K, -1, 1)
+  f = f.reshape(K, -1, 2)
+  E_B_f = np.matmul(np.repeat(atoms, num_nodes, axis=0).T, prob * f)
+  E_f_f = np.matmul(f.transpose(0,2,1), prob * f)
+  return E_B_f, E_f_f
+
+def f_k_bayes_sparse_moments(M_k_B, T_k_B, eps_vec, alpha, num_points=20):
+  # E[B_bar f_k^T] and E[f_k f_k^T] for B_k = M_k_B B_bar + G, G ~ N(0, T_k_B), the
+  # input side of the state evolution. B_bar takes one of the 9 atoms, so the
+  # expectation is an exact sum over the atoms of a Gauss-Hermite rule over G.
+  # M_k_B and T_k_B can also be stacks of K matrices (K x 2 x 2), which are all
+  # evaluated together and give K x 2 x 2 stacks, and eps_vec can then be a K x 2
+  # stack too, one prior per matrix.
+  M_k_B = np.asarray(M_k_B, dtype=float)
+  T_k_B = np.asarray(T_k_B, dtype=float)
+  batch_shape = M_k_B.shape[:-2]
+  M_k_B = M_k_B.reshape(-1, 2, 2)
+  T_k_B = T_k_B.reshape(-1, 2, 2)
+
+  atoms, atoms_pmf, means, B_k, prob, T_k_B_inv = _sparse_se_nodes(M_k_B, T_k_B, eps_vec, alpha, num_points)
+  with np.errstate(divide='ignore'):
+    log_atoms_pmf = np.log(atoms_pmf)
+
+  # log P(b_bar) - (B_k - M_k_B b_bar)^T T_k_B^+ (B_k - M_k_B b_bar) / 2 up to the term
+  # in B_k alone, which the normalization over b_bar removes.
+  T_k_B_inv_means = np.matmul(means, T_k_B_inv)
+  num_atoms, num_nodes = B_k.shape[1:3]
+  log_weights = np.matmul(B_k.reshape(len(B_k), -1, 2), T_k_B_inv_means.transpose(0,2,1)).reshape(len(B_k), num_atoms, num_nodes, -1)
+  log_weights += (log_atoms_pmf - 0.5 * np.sum(T_k_B_inv_means * means, axis=2))[:, None, None, :]
+  log_weights -= np.max(log_weights, axis=3, keepdims=True)
+  post = np.exp(log_weights)
+  post /= np.sum(post, axis=3, keepdims=True)
+  f = np.dot(post, atoms)
+
+  E_B_f, E_f_f = _sparse_se_moments(atoms, B_k, prob, f)
+  return E_B_f.reshape(batch_shape + (2, 2)), E_f_f.reshape(batch_shape + (2, 2))
+
+def f_k_bayes_sparse(B_bar_k, M_k_B, T_k_B, eps_vec, alpha):
+  # Denoises a single row or a p x 2 matrix.
+  output, _ = f_k_bayes_and_prime_sparse(np.atleast_2d(B_bar_k), M_k_B, T_k_B, eps_vec, alpha)
+  return output.reshape(np.shape(B_bar_k))
+
+class SparsePrior:
+
+  def __init__(self, eps_vec, alpha):
+    self.eps_vec = eps_vec
+    self.alpha = alpha
+
+  def f_k(self, B_k_plus_1, M_k_B, T_k_B):
+    return f_k_bayes_and_prime_sparse(B_k_plus_1, M_k_B, T_k_B, self.eps_vec, self.alpha)
+
+  def se_moments(self, M_k_B, T_k_B, num_points=20):
+    return f_k_bayes_sparse_moments(M_k_B, T_k_B, self.eps_vec, self.alpha, num_points)
+
+''' === Soft thresholding, a prior-free alternative to the Bayes denoisers === '''
+
+def soft_threshold(input, threshold):
+  # Elementwise, so input can be a whole matrix with one threshold per column.
+  return np.sign(input) * np.maximum(np.abs(input) - threshold, 0)
+
+def f_k_ST_and_prime(B_bar_k, M_k_B, T_k_B, ST_param):
+  # Note that ST_param is usually alpha but here our alpha is used as a
+  # parameter to control the prior.
+  # All p rows of B_bar_k are whitened and thresholded at once, and the Jacobian
+  # of f_k averaged over the rows is returned alongside the p x 2 output.
+
+  inv_M_k_B = linalg.pinv(M_k_B)
+  modified_B_bar_k = np.dot(B_bar_k, inv_M_k_B.T)
+  noise_cov = np.dot(inv_M_k_B, np.dot(T_k_B, inv_M_k_B.T))
+  threshold = ST_param * np.sqrt(np.diag(noise_cov))
+  output = soft_threshold(modified_B_bar_k, threshold)
+
+  # Row l of the Jacobian of a row is row l of inv_M_k_B if coordinate l survives
+  # the threshold and 0 otherwise, so only the number of active rows is needed.
+  active_frac = np.mean(np.abs(modified_B_bar_k) > threshold, axis=0)
+  output_prime = np.dot(np.diag(active_frac), inv_M_k_B)
+
+  return output, output_prime
+
+def f_k_ST_sparse_moments(M_k_B, T_k_B, ST_param, eps_vec, alpha, num_points=20):
+  # E[B_bar f_k^T] and E[f_k f_k^T] of soft thresholding for B_k = M_k_B B_bar + G,
+  # G ~ N(0, T_k_B), when B_bar has the sparse prior, summed over the atoms and a
+  # Gauss-Hermite rule over G like f_k_bayes_sparse_moments. Also takes stacks.
+  M_k_B = np.asarray(M_k_B, dtype=float)
+  T_k_B = np.asarray(T_k_B, dtype=float)
+  batch_shape = M_k_B.shape[:-2]
+  M_k_B = M_k_B.reshape(-1, 2, 2)
+  T_k_B = T_k_B.reshape(-1, 2, 2)
+
+  atoms, _, _, B_k, prob, _ = _sparse_se_nodes(M_k_B, T_k_B, eps_vec, alpha, num_points)
+
+  # The thresholds of f_k_ST_and_prime, one pair per matrix.
+  inv_M_k_B = linalg.pinv(M_k_B)
+  noise_cov = np.matmul(inv_M_k_B, np.matmul(T_k_B, inv_M_k_B.transpose(0,2,1)))
+  threshold = ST_param * np.sqrt(np.diagonal(noise_cov, axis1=1, axis2=2))
+  modified_B_k = np.einsum('kagj,kij->kagi', B_k, inv_M_k_B)
+  f = soft_threshold(modified_B_k, threshold[:, None, None, :])
+
+  E_B_f, E_f_f = _sparse_se_moments(atoms, B_k, prob, f)
+  return E_B_f.reshape(batch_shape + (2, 2)), E_f_f.reshape(batch_shape + (2, 2))
+
+class SoftThreshold:
+
+  def __init__(self, ST_param, eps_vec=None, alpha=None):
+    # eps_vec and alpha, the sparse prior the signals are drawn from, are only
+    # needed for the state evolution.
+    self.ST_param = ST_param
+    self.eps_vec = eps_vec
+    self.alpha = alpha
+
+  def f_k(self, B_k_plus_1, M_k_B, T_k_B):
+    return f_k_ST_and_prime(B_k_plus_1, M_k_B, T_k_B, self.ST_param)
+
+  def se_moments(self, M_k_B, T_k_B, num_points=20):
+    if self.eps_vec is None or self.alpha is None:
+      raise ValueError('the SE of SoftThreshold needs the sparse prior of B_bar, pass eps_vec and alpha')
+    return f_k_ST_sparse_moments(M_k_B, T_k_B, self.ST_param, self.eps_vec, self.alpha, num_points)
@@ -0,0 +1,104 @@
+import os
+import hashlib
+import numpy as np
+
+from .metrics import norm_sq_corr, MSE
+
+class ResultsStore:
+  '''
+  A folder of .npz chunks that together form one table. Every append writes one
+  chunk: the metric columns (1-D arrays of the same length, e.g. one entry per
+  iteration of one trial) plus the parameters of that trial, repeated on every row.
+  A parameter can also be an array (e.g. B_bar_cov), which gives a column of shape
+  num_rows x its shape.
+  Chunks are named after their parameters, so workers can append at the same time
+  without locking, and appending the same parameters again (e.g. after a resumed
+  sweep) replaces the chunk instead of adding duplicate rows.
+
+  load() reads only the requested columns, so summaries can be recomputed from
+  the store without rerunning GAMP or loading the whole table. A chunk without one
+  of them gets NaN there, and a column that is in no chunk raises a KeyError.
+  '''
+
+  def __init__(self, path):
+    self.path = path
+    os.makedirs(path, exist_ok=True)
+
+  def append(self, params, columns):
+    num_rows = len(next(iter(columns.values())))
+    table = {name: np.asarray(column) for name, column in columns.items()}
+    for name, value in params.items():
+      table[name] = np.broadcast_to(value, (num_rows,) + np.shape(value))
+
+    # Arrays go into the name as lists, whose repr does not depend on the print options.
+    key_params = sorted((name, np.asarray(value).tolist() if np.ndim(value) > 0 else value) for name, value in params.items())
+    key = hashlib.sha1(repr(key_params).encode()).hexdigest()
+    chunk_path = os.path.join(self.path, 'chunk_' + key + '.npz')
+
+    # Written under a temporary name and renamed, so readers never see half a chunk.
+    tmp_path = chunk_path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_path, 'wb') as f:
+      np.savez(f, **table)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp_path, chunk_path)
+
+  def chunks(self):
+    return sorted(os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith('.npz'))
+
+  def columns(self):
+    names = set()
+    for chunk_path in self.chunks():
+      with np.load(chunk_path) as chunk:
+        names.update(chunk.files)
+    return sorted(names)
+
+  def load(self, *names):
+    # Returns {name: column} over all chunks, in chunk order, which line up row by
+    # row. A chunk without one of the columns (e.g. no SE prediction) gets NaN in it.
+    parts = {name: [] for name in names}
+    num_rows = []
+    for chunk_path in self.chunks():
+      with np.load(chunk_path) as chunk:
+        num_rows.append(len(chunk[chunk.files[0]]))
+        for name in names:
+          parts[name].append(chunk[name] if name in chunk.files else None)
+
+    output = {}
+    for name in names:
+      present = [part for part in parts[name] if part is not None]
+      if num_rows and not present:
+        raise KeyError('no chunk of ' + self.path + ' has the column ' + name)
+      if not num_rows:
+        output[name] = np.zeros(0)
+        continue
+      shape = present[0].shape[1:]
+      output[name] = np.concatenate([np.full((rows,) + shape, np.nan) if part is None else part
+                                     for part, rows in zip(parts[name], num_rows)])
+    return output
+
+def gamp_iteration_columns(B, B_hat_storage, M_k_B_storage=None, SE_norm_sq_corr=None, seconds=None):
+  # Per-iteration metrics of one GAMP trial, one row per entry of B_hat_storage
+  # (row 0 is the initialization). SE_norm_sq_corr, if given, maps a stack of M_k_B
+  # to the state evolution prediction of the L norm sq corrs, one array over the
+  # stack per signal. It is called once on all of M_k_B_storage, and row k takes its
+  # prediction from M_k_B_storage[k-1]; row 0 has none and gets NaN. seconds, the
+  # wall time of the trial, is repeated on every row.
+  L = B.shape[1]
+  num_rows = len(B_hat_storage)
+  columns = {'iter': np.arange(num_rows)}
+  for l in range(L):
+    columns['corr' + str(l+1)] = np.array([norm_sq_corr(B[:, l], B_hat[:, l]) for B_hat in B_hat_storage])
+    columns['MSE' + str(l+1)] = np.array([MSE(B[:, l], B_hat[:, l]) for B_hat in B_hat_storage])
+
+  if SE_norm_sq_corr is not None:
+    SE_corr = np.full((num_rows, L), np.nan)
+    if num_rows > 1:
+      SE_corr[1:] = np.stack(SE_norm_sq_corr(np.array(M_k_B_storage[:num_rows-1])), axis=-1)
+    for l in range(L):
+      columns['corr' + str(l+1) + '_SE'] = SE_corr[:, l]
+
+  if seconds is not None:
+    columns['seconds'] = np.full(num_rows, seconds)
+
+  return columns
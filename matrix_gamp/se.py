@@ -0,0 +1,212 @@
+import numpy as np
+from numpy.random import multivariate_normal
+from numpy.polynomial.hermite_e import hermegauss
+
+'''
+State evolution without data. The SE of matrix-GAMP tracks Sigma_k and M_k_B,
+which GAMP itself only estimates from R_hat_k and B_hat_k. Here they are computed
+from their definitions: the expectation over the output side, E[g_k g_k^T], comes
+from the channel (se_M_k) and the one over the input side from the prior
+(se_moments). The expectations over Gaussian vectors are taken with Gauss-Hermite
+cubature, so an SE curve is deterministic and takes no O(np) simulation.
+
+SE_norm_sq_corr_and_MSE turns the moments of the prior at one M_k_B, or at a whole
+stack of them, into the SE norm sq corr and MSE of every signal. For priors without
+a closed form, MC_norm_sq_corr estimates the SE norm sq corr at a given M_k_B by
+Monte Carlo instead, with a standard error.
+'''
+
+def hermite_grid(r, num_points):
+  # Nodes (one per row) and weights of the tensor Gauss-Hermite rule for N(0, I_r),
+  # exact for polynomials of degree up to 2 num_points - 1 in each direction.
+  x, w = hermegauss(num_points)
+  w = w / np.sqrt(2 * np.pi)
+  grid = np.stack(np.meshgrid(*([x] * r), indexing='ij'), axis=-1).reshape(-1, r)
+  weights = np.ones(1)
+  for _ in range(r):
+    weights = np.outer(weights, w).ravel()
+  return grid, weights
+
+def gauss_hermite_normal(cov, num_points):
+  # The same rule for N(0, cov). Directions with a zero eigenvalue carry no
+  # randomness and are left out, so a singular cov costs fewer nodes.
+  s, u = np.linalg.eigh(cov)
+  keep = s > 1e-12 * max(np.max(s), 1e-300)
+  factor = u[:, keep] * np.sqrt(s[keep])
+
+  grid, weights = hermite_grid(factor.shape[1], num_points)
+  return np.dot(grid, factor.T), weights
+
+def state_evolution(channel, prior, B_bar_mean, B_bar_cov, Sigma_0, delta, num_iter, num_points=24):
+  # Runs the SE recursion from Sigma_0 for num_iter iterations. Returns the
+  # predicted norm sq corr of every column after every iteration (num_iter x L)
+  # and the list of M_k_B, which is what the SE formulas of the run scripts take
+  # in place of the M_k_B_storage of a GAMP run. Stops early, like GAMP given the
+  # true B, if Sigma_k is not PSD or the smallest corr stops improving; the latter
+  # is what ends a noiseless run whose prior allows exact recovery, after which
+  # Sigma_k is singular.
+  B_bar_mean = np.asarray(B_bar_mean, dtype=float)
+  E_B_B = B_bar_cov + np.outer(B_bar_mean, B_bar_mean)
+  L = len(B_bar_mean)
+
+  Sigma_k = Sigma_0
+  corrs = []
+  prev_min_corr = 0
+  M_k_B_storage = []
+  for k in range(num_iter):
+    step = _se_step(channel, prior, Sigma_k, E_B_B, delta, num_points)
+    if step is None:
+      break
+    M_k_plus_1_B, corrs_k_plus_1, Sigma_k = step
+    if not (np.min(corrs_k_plus_1) > prev_min_corr):
+      break
+    prev_min_corr = np.min(corrs_k_plus_1)
+    corrs.append(corrs_k_plus_1)
+    M_k_B_storage.append(M_k_plus_1_B)
+
+  return np.array(corrs).reshape(-1, L), M_k_B_storage
+
+def _se_step(channel, prior, Sigma_k, E_B_B, delta, num_points):
+  # One SE iteration: M_{k+1}^B from Sigma_k, the norm sq corrs it predicts and
+  # Sigma_{k+1}, or None if Sigma_k is not PSD. Sigma_{k+1} keeps the block of B_bar
+  # and takes E[f_k f_k^T] / delta for the other three.
+  Sigma_k_state = channel.factorize(Sigma_k)
+  if not Sigma_k_state.is_pos_semi_def:
+    return None
+
+  M_k_plus_1_B = channel.se_M_k(Sigma_k_state, num_points)
+  T_k_plus_1_B = M_k_plus_1_B
+
+  E_B_f, E_f_f = prior.se_moments(M_k_plus_1_B, T_k_plus_1_B)
+  corrs_k_plus_1 = np.square(np.diag(E_B_f)) / (np.diag(E_B_B) * np.diag(E_f_f))
+
+  L = len(E_B_B)
+  Sigma_k_plus_1 = np.zeros((2*L,2*L))
+  Sigma_k_plus_1[:L,:L] = Sigma_k[:L,:L]
+  Sigma_k_plus_1[:L,L:] = E_f_f / delta
+  Sigma_k_plus_1[L:,:L] = E_f_f / delta
+  Sigma_k_plus_1[L:,L:] = E_f_f / delta
+  return M_k_plus_1_B, corrs_k_plus_1, Sigma_k_plus_1
+
+def se_fixed_point(channel, prior, B_bar_mean, B_bar_cov, Sigma_0, delta, tol=1e-6, eps=1e-3,
+                   max_iter=100, memory=5, num_points=24):
+  # The fixed point of the SE, found with Anderson acceleration rather than by
+  # running the recursion for a fixed num_iter. From Sigma_1 on, Sigma_k is fixed by
+  # its L x L block Q = E[f f^T] / delta, so the solver works on the map from Q to
+  # the next Q. Each step mixes the last memory + 1 images of the map so as to
+  # minimize the residual, and falls back to the plain image whenever the mixed Q
+  # gives a Sigma_k that is not PSD. Stops once the residual is within tol (relative
+  # to the largest entry of Q, or absolute below 1).
+  #
+  # Returns the norm sq corrs and M_k_B at the fixed point, the number of maps the
+  # solver evaluated, and the number of plain iterations from Sigma_0 (i.e. of
+  # GAMP) after which every corr is within eps of the fixed point. Either count is
+  # None if it is not reached within max_iter. A prior that allows exact recovery
+  # has a singular Sigma_k at its fixed point, which the solver may not reach.
+  B_bar_mean = np.asarray(B_bar_mean, dtype=float)
+  E_B_B = B_bar_cov + np.outer(B_bar_mean, B_bar_mean)
+  L = len(B_bar_mean)
+
+  step = _se_step(channel, prior, Sigma_0, E_B_B, delta, num_points)
+  if step is None:
+    raise ValueError('Sigma_0 is not PSD')
+  M_k_B, corrs, Sigma_k = step
+  Q = Sigma_k[L:, L:]
+
+  Q_storage = []
+  F_Q_storage = []
+  num_solver_iter = None
+  for k in range(1, max_iter + 1):
+    Sigma_k[:L, L:] = Q
+    Sigma_k[L:, :L] = Q
+    Sigma_k[L:, L:] = Q
+    step = _se_step(channel, prior, Sigma_k, E_B_B, delta, num_points)
+    if step is None:
+      if not F_Q_storage:
+        break
+      Q = F_Q_storage[-1]
+      Q_storage = []
+      F_Q_storage = []
+      continue
+    M_k_B, corrs, Sigma_k_plus_1 = step
+    F_Q = Sigma_k_plus_1[L:, L:]
+    if np.max(np.abs(F_Q - Q)) <= tol * max(np.max(np.abs(Q)), 1):
+      num_solver_iter = k
+      break
+
+    Q_storage = (Q_storage + [Q])[-(memory+1):]
+    F_Q_storage = (F_Q_storage + [F_Q])[-(memory+1):]
+    if len(Q_storage) == 1:
+      Q = F_Q
+      continue
+    # gamma minimizes |r_k - sum_i gamma_i (r_{i+1} - r_i)| over the stored
+    # residuals r_i = F(Q_i) - Q_i, and the next Q mixes the images the same way.
+    residuals = np.array([(F - X).ravel() for X, F in zip(Q_storage, F_Q_storage)])
+    images = np.array([F.ravel() for F in F_Q_storage])
+    gamma = np.linalg.lstsq(np.diff(residuals, axis=0).T, residuals[-1], rcond=None)[0]
+    Q = (images[-1] - np.dot(gamma, np.diff(images, axis=0))).reshape(L, L)
+    Q = (Q + Q.T) / 2
+
+  # How long the plain recursion takes to get within eps of the fixed point.
+  num_plain_iter = None
+  if num_solver_iter is not None:
+    Sigma_k = Sigma_0
+    for k in range(1, max_iter + 1):
+      step = _se_step(channel, prior, Sigma_k, E_B_B, delta, num_points)
+      if step is None:
+        break
+      _, corrs_k, Sigma_k = step
+      if np.max(np.abs(corrs_k - corrs)) <= eps:
+        num_plain_iter = k
+        break
+
+  return corrs, M_k_B, num_solver_iter, num_plain_iter
+
+def SE_norm_sq_corr_and_MSE(prior, M_k_B, E_B_bar_sq, T_k_B=None):
+  # The SE norm sq corr E[f_l B_bar_l]^2 / (E[f_l^2] E[B_bar_l^2]) and the SE MSE
+  # E[(f_l - B_bar_l)^2] of every signal l, from the moments of prior.se_moments.
+  # M_k_B can be one L x L matrix or a stack of them (... x L x L), e.g. every
+  # iteration of every run at every delta, which all go through one call and give
+  # ... x L arrays. T_k_B is M_k_B unless given.
+  if T_k_B is None:
+    T_k_B = M_k_B
+  E_B_f, E_f_f = prior.se_moments(M_k_B, T_k_B)
+  E_B_f = np.diagonal(E_B_f, axis1=-2, axis2=-1)
+  E_f_f = np.diagonal(E_f_f, axis1=-2, axis2=-1)
+  corrs = np.square(E_B_f) / (E_f_f * E_B_bar_sq)
+  MSEs = E_B_bar_sq - 2 * E_B_f + E_f_f
+  return corrs, MSEs
+
+def MC_norm_sq_corr(prior, B_bar_samples, M_k_B, T_k_B, E_B_bar_sq, chunk_size=100000):
+  # The SE norm sq corr E[f_l B_bar_l]^2 / (E[f_l^2] E[B_bar_l^2]) of every column l,
+  # with f = f_k(M_k_B B_bar + G) and G ~ N(0, T_k_B), estimated from the rows of
+  # B_bar_samples. The samples are denoised chunk_size rows at a time by the batched
+  # prior.f_k and only the sums of f_l B_bar_l, f_l^2 and their squares and product
+  # are kept. Also returns the delta-method standard error of each estimate.
+  num_MC_samples, L = B_bar_samples.shape
+  G_k_B_samples = multivariate_normal(np.zeros(L), T_k_B, num_MC_samples)
+
+  sums = np.zeros((5, L))
+  for start in range(0, num_MC_samples, chunk_size):
+    end = min(start + chunk_size, num_MC_samples)
+    s = np.dot(B_bar_samples[start:end], M_k_B.T) + G_k_B_samples[start:end]
+    f, _ = prior.f_k(s, M_k_B, T_k_B)
+    f_B_bar = f * B_bar_samples[start:end]
+    f_sq = np.square(f)
+    sums += [np.sum(f_B_bar, axis=0), np.sum(f_sq, axis=0), np.sum(np.square(f_B_bar), axis=0),
+             np.sum(np.square(f_sq), axis=0), np.sum(f_B_bar * f_sq, axis=0)]
+
+  E_f_B_bar, E_f_sq, E_f_B_bar_sq, E_f_sq_sq, E_cross = sums / num_MC_samples
+  corrs = np.square(E_f_B_bar) / (E_f_sq * E_B_bar_sq)
+
+  # corr = a^2 / (b E_B_bar_sq) for the sample means a and b, whose covariance is
+  # the sample covariance of (f_l B_bar_l, f_l^2) over num_MC_samples.
+  grad_a = 2 * E_f_B_bar / (E_f_sq * E_B_bar_sq)
+  grad_b = -corrs / E_f_sq
+  var_a = E_f_B_bar_sq - np.square(E_f_B_bar)
+  var_b = E_f_sq_sq - np.square(E_f_sq)
+  cov_ab = E_cross - E_f_B_bar * E_f_sq
+  var = np.square(grad_a) * var_a + 2 * grad_a * grad_b * cov_ab + np.square(grad_b) * var_b
+  std_errs = np.sqrt(np.maximum(var, 0) / num_MC_samples)
+
+  return corrs, std_errs
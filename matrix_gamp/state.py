@@ -0,0 +1,105 @@
+import numpy as np
+from numpy import linalg
+
+from scipy.linalg import eigh
+
+''' === The state evolution covariance Sigma_k and what GAMP needs from it === '''
+
+# Copied this function over from scipy library
+def _eigvalsh_to_eps(spectrum, cond=None, rcond=None):
+    if rcond is not None:
+        cond = rcond
+    if cond in [None, -1]:
+        t = spectrum.dtype.char.lower()
+        factor = {'f': 1E3, 'd': 1E6}
+        cond = factor[t] * np.finfo(t).eps
+    eps = cond * np.max(abs(spectrum))
+    return eps
+
+def generate_Sigma_0(delta, B_bar_mean, B_bar_cov, B_hat_0_row_mean, B_hat_0_row_cov):
+  # Sigma_0 is the 2L x 2L second moment of (B_bar, B_hat_0_row) scaled by 1/delta,
+  # where the rows of B and B_hat_0 are drawn independently.
+
+  B_bar_mean = np.asarray(B_bar_mean, dtype=float)
+  B_hat_0_row_mean = np.asarray(B_hat_0_row_mean, dtype=float)
+  L = len(B_bar_mean)
+
+  Sigma_0 = np.zeros((2*L, 2*L))
+  Sigma_0[:L, :L] = B_bar_cov + np.outer(B_bar_mean, B_bar_mean)
+  Sigma_0[:L, L:] = np.outer(B_bar_mean, B_hat_0_row_mean)
+  Sigma_0[L:, :L] = Sigma_0[:L, L:].T
+  Sigma_0[L:, L:] = B_hat_0_row_cov + np.outer(B_hat_0_row_mean, B_hat_0_row_mean)
+
+  return Sigma_0 / delta
+
+class SigmaK:
+  '''
+  Everything the denoisers need from Sigma_k within one GAMP iteration. Sigma_k
+  does not change from row to row, so its blocks, their pseudo-inverses, the
+  regression coefficients and the log-determinants are computed once here.
+
+  The densities of (Z_k, Y_bar) are only set up when the noise level sigma is
+  given, i.e. for mixed linear regression, where Y_bar is Gaussian given Z.
+  '''
+
+  def __init__(self, Sigma_k, sigma=None):
+    L = len(Sigma_k) // 2
+    self.L = L
+    self.Sigma_k = Sigma_k
+    self.Sigma_11 = Sigma_k[:L, :L]
+    self.Sigma_12 = Sigma_k[:L, L:]
+    self.Sigma_21 = Sigma_k[L:, :L]
+    self.Sigma_22 = Sigma_k[L:, L:]
+    self.Sigma_22_inv = linalg.pinv(self.Sigma_22)
+
+    # E[Z|Z_k] = coef Z_k and Var(Z|Z_k).
+    self.coef = np.dot(self.Sigma_12, self.Sigma_22_inv)
+    self.Var_Z_given_Zk = self.Sigma_11 - np.dot(self.coef, self.Sigma_21)
+    self.Var_Z_given_Zk_inv = linalg.pinv(self.Var_Z_given_Zk)
+
+    self.is_pos_semi_def = True
+    if sigma is None:
+      return
+
+    # Given that Y_bar comes from signal l, (Z, Z_k, Y_bar) has covariance Sigma_kl_Y.
+    # For every l we keep the covariance of (Z_k, Y_bar), the coefficients of
+    # E[Z|Z_k,Y_bar] and a factorization for the density of (Z_k, Y_bar).
+    # If any of these covariances is not PSD, GAMP cannot continue.
+    self.cov_Y = []
+    self.coef_Y = []
+    self.whiten_Y = []
+    self.log_pdet_Y = []
+    for l in range(L):
+      Sigma_kl_Y = np.zeros((2*L+1, 2*L+1))
+      Sigma_kl_Y[:2*L, :2*L] = Sigma_k
+      Sigma_kl_Y[2*L, :2*L] = Sigma_k[l, :]
+      Sigma_kl_Y[:2*L, 2*L] = Sigma_k[l, :]
+      Sigma_kl_Y[2*L, 2*L] = Sigma_k[l, l] + sigma**2
+      cov = Sigma_kl_Y[L:, L:]
+      self.cov_Y.append(cov)
+      self.coef_Y.append(np.dot(Sigma_kl_Y[:L, L:], linalg.pinv(cov)))
+
+      # Same eigenvalue cut-off as multivariate_normal_sp(..., allow_singular=True).
+      s, u = eigh(cov)
+      eps = _eigvalsh_to_eps(s)
+      if np.min(s) < -eps:
+        self.is_pos_semi_def = False
+      keep = s > eps
+      self.whiten_Y.append(u[:, keep] / np.sqrt(s[keep]))
+      self.log_pdet_Y.append(np.sum(np.log(s[keep])))
+
+  def logpdf_Y(self, l, Zk_Ybar):
+    # Log-density of (Z_k, Y_bar) given signal l, at one point or at every row of a matrix.
+    whiten = self.whiten_Y[l]
+    maha = np.sum(np.square(np.dot(Zk_Ybar, whiten)), axis=-1)
+    return -0.5 * (whiten.shape[1] * np.log(2 * np.pi) + self.log_pdet_Y[l] + maha)
+
+def E_Z_given_Zk(Sigma_k_state, Z_k):
+  return np.dot(Z_k, Sigma_k_state.coef.T)
+
+def compute_C_k(Theta_k, R_hat_k, Sigma_k_state):
+  n = len(Theta_k)
+  part1 = np.dot(Theta_k.T, R_hat_k)/n
+  part2 = np.dot(Sigma_k_state.Sigma_21, np.dot(R_hat_k.T, R_hat_k)/n)
+  output = np.dot(Sigma_k_state.Sigma_22_inv, part1 - part2)
+  return output.T
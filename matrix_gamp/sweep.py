@@ -0,0 +1,99 @@
+import os
+import pickle
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+'''
+Runs the independent cells of a parameter sweep, e.g. one (delta, run) pair each,
+on a pool of processes. task must be a module-level function so that the workers
+can find it, and every cell must set its own seed, as the serial loops already do
+with np.random.seed(run_num); the results then do not depend on which worker ran
+which cell. Scripts that call run_sweep with more than one worker need the usual
+if __name__ == '__main__': guard, since the workers import the script again.
+
+If checkpoint_dir is given, the result of every cell is written there as soon as
+it is done, and cells already found there are not run again. A sweep that was
+killed half-way therefore picks up where it stopped when it is started again.
+'''
+
+# Each worker gets blas_threads BLAS threads, so that num_workers workers do not
+# each start one thread per core.
+BLAS_THREAD_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                    'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+def checkpoint_path(checkpoint_dir, task, args):
+  # One file per cell, named after the task and its arguments, so a cell of a
+  # different grid (or with different parameters) never picks up this result.
+  key = hashlib.sha1(pickle.dumps((task.__name__, args))).hexdigest()
+  return os.path.join(checkpoint_dir, task.__name__ + '_' + key + '.pkl')
+
+def save_checkpoint(path, result):
+  # Written to a temporary file first and then renamed, so a crash half-way
+  # through leaves either the old state or the full result, never a partial file.
+  tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+  with open(tmp_path, 'wb') as f:
+    pickle.dump(result, f)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+  with open(path, 'rb') as f:
+    return pickle.load(f)
+
+def run_sweep(task, args_list, num_workers=1, blas_threads=1, checkpoint_dir=None, task_kwargs=None):
+  # Returns [task(*args, **task_kwargs) for args in args_list], in that order.
+  # num_workers=None uses every core and num_workers=1 runs the cells here, one
+  # after the other.
+  args_list = list(args_list)
+  if task_kwargs is None:
+    task_kwargs = {}
+  results = [None] * len(args_list)
+  todo = list(range(len(args_list)))
+
+  if checkpoint_dir is not None:
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    # Keyword arguments are part of a cell, but only change its file when given.
+    keys = args_list if not task_kwargs else [(args, sorted(task_kwargs.items())) for args in args_list]
+    paths = [checkpoint_path(checkpoint_dir, task, key) for key in keys]
+    todo = []
+    for i in range(len(args_list)):
+      if os.path.exists(paths[i]):
+        results[i] = load_checkpoint(paths[i])
+      else:
+        todo.append(i)
+    if len(todo) < len(args_list):
+      print('=== Loaded ' + str(len(args_list) - len(todo)) + ' of ' + str(len(args_list)) + ' cells from ' + checkpoint_dir + ' ===')
+
+  def finish(i, result):
+    results[i] = result
+    if checkpoint_dir is not None:
+      save_checkpoint(paths[i], result)
+
+  if num_workers is None:
+    num_workers = os.cpu_count()
+  num_workers = min(num_workers, len(todo))
+  if num_workers <= 1:
+    for i in todo:
+      finish(i, task(*args_list[i], **task_kwargs))
+    return results
+
+  # The workers are started fresh (spawn), so they read the thread counts from
+  # the environment when they import numpy.
+  saved_env = {var: os.environ.get(var) for var in BLAS_THREAD_VARS}
+  for var in BLAS_THREAD_VARS:
+    os.environ[var] = str(blas_threads)
+  try:
+    with ProcessPoolExecutor(num_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+      futures = {pool.submit(task, *args_list[i], **task_kwargs): i for i in todo}
+      for future in as_completed(futures):
+        finish(futures[future], future.result())
+  finally:
+    for var, value in saved_env.items():
+      if value is None:
+        os.environ.pop(var, None)
+      else:
+        os.environ[var] = value
+
+  return results
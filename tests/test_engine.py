@@ -0,0 +1,52 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from matrix_gamp import MatrixGAMP, MLRChannel, GaussianPrior, generate_Sigma_0
+
+@pytest.mark.parametrize('out_of_core', [False, True])
+def test_run_batch_matches_run(out_of_core, tmp_path):
+  # run_batch on R trials should return what run() returns for each of them. Trial
+  # 1 gets Y unrelated to B, and trial 0 a poor start, so both stop early and are
+  # dropped while trial 2 runs all iterations. A memory-mapped X stays whole, so
+  # its blocks are indexed by the trials still running, and it is read in several
+  # blocks of rows.
+  R, n, p, L, sigma, num_iter = 3, 300, 100, 2, 0.1, 8
+  alpha_vec = np.array([0.6, 0.4])
+  rng = np.random.default_rng(0)
+  X = rng.normal(0, np.sqrt(1/n), (R, n, p))
+  if out_of_core:
+    np.save(tmp_path / 'X.npy', X)
+    X = np.load(tmp_path / 'X.npy', mmap_mode='r')
+  B = rng.normal(size=(R, p, L))
+  B_hat_0 = rng.normal(size=(R, p, L))
+  c = rng.random((R, n)) < alpha_vec[0]
+  Y = np.where(c, np.einsum('rnp,rp->rn', X, B[:, :, 0]), np.einsum('rnp,rp->rn', X, B[:, :, 1]))
+  Y += sigma * rng.normal(size=(R, n))
+  Y[1] = rng.normal(size=n)
+
+  B_bar_mean = np.zeros(L)
+  B_bar_cov = np.eye(L)
+  Sigma_0 = generate_Sigma_0(n/p, B_bar_mean, B_bar_cov, B_bar_mean, B_bar_cov)
+  block_rows = 37 if out_of_core else None
+
+  channel = MLRChannel(alpha_vec, sigma)
+  prior = GaussianPrior(B_bar_mean, B_bar_cov)
+  B_hat_batch, M_k_B_batch = MatrixGAMP(channel, prior, B, block_rows).run_batch(X, Y, B_hat_0, Sigma_0, num_iter)
+
+  num_steps = []
+  for r in range(R):
+    B_hat, M_k_B = MatrixGAMP(channel, prior, B[r], block_rows).run(np.asarray(X[r]), Y[r], B_hat_0[r], Sigma_0, num_iter)
+    assert len(B_hat_batch[r]) == len(B_hat)
+    assert len(M_k_B_batch[r]) == len(M_k_B)
+    for a, b in zip(B_hat_batch[r], B_hat):
+      np.testing.assert_allclose(a, b, rtol=0, atol=1e-12)
+    for a, b in zip(M_k_B_batch[r], M_k_B):
+      np.testing.assert_allclose(a, b, rtol=0, atol=1e-12)
+    num_steps.append(len(B_hat))
+
+  assert min(num_steps) < num_iter + 1
+  assert num_steps[2] == num_iter + 1
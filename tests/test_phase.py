@@ -0,0 +1,82 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from matrix_gamp import MatrixGAMP, MLRChannel, GaussianPrior, generate_Sigma_0, norm_sq_corr, state_evolution, mismatched_MLR_corr, phase_diagram
+
+def test_mismatched_MLR_corr_matches_GAMP():
+  # GAMP with est_p1 = 0.5 on data from p1 = 0.7 recovers beta1 far better than
+  # beta2, and the mismatched SE should say so. 5 iterations of 4 runs at p = 1000,
+  # so the tolerance covers the Monte Carlo error (about 0.01) and the
+  # approximation of the SE under a mismatch.
+  p, delta, p1, est_p1, num_iter, num_runs = 1000, 2, 0.7, 0.5, 5, 4
+  n = int(delta * p)
+  B_bar_mean = np.zeros(2)
+  B_bar_cov = np.eye(2)
+  Sigma_0 = generate_Sigma_0(delta, B_bar_mean, B_bar_cov, B_bar_mean, B_bar_cov)
+
+  corrs = np.zeros((num_runs, 2))
+  for run_num in range(num_runs):
+    rng = np.random.default_rng(run_num)
+    B = rng.normal(size=(p, 2))
+    B_hat_0 = rng.normal(size=(p, 2))
+    X = rng.normal(0, np.sqrt(1/n), (n, p))
+    c = rng.random(n) < p1
+    Y = np.where(c, np.dot(X, B[:, 0]), np.dot(X, B[:, 1]))
+
+    channel = MLRChannel(np.array([est_p1, 1 - est_p1]), 0)
+    prior = GaussianPrior(B_bar_mean, B_bar_cov)
+    B_hat_storage, _ = MatrixGAMP(channel, prior).run(X, Y, B_hat_0, Sigma_0, num_iter)
+    corrs[run_num] = [norm_sq_corr(B[:, l], B_hat_storage[-1][:, l]) for l in range(2)]
+
+  corrs_SE = mismatched_MLR_corr([p1], [est_p1], [delta], B_bar_mean, B_bar_cov, B_bar_mean, B_bar_cov, 0, num_iter)[0]
+  assert np.allclose(np.mean(corrs, axis=0), corrs_SE, atol=0.03)
+
+def test_mismatched_MLR_corr_without_mismatch():
+  # With est_p1 = p1 the SE is that of state_evolution, up to the Gauss-Hermite rule
+  # in M_{k+1}^B = E[d g_k / d Z], which then equals E[g_k g_k^T].
+  B_bar_mean = np.zeros(2)
+  B_bar_cov = np.eye(2)
+  p1_list = [0.7, 0.6]
+  delta_list = [1.5, 3]
+  corrs = mismatched_MLR_corr(p1_list, p1_list, delta_list, B_bar_mean, B_bar_cov, B_bar_mean, B_bar_cov, 0.1, 10)
+  for p1, delta, corrs_point in zip(p1_list, delta_list, corrs):
+    Sigma_0 = generate_Sigma_0(delta, B_bar_mean, B_bar_cov, B_bar_mean, B_bar_cov)
+    channel = MLRChannel(np.array([p1, 1 - p1]), 0.1)
+    corrs_SE, _ = state_evolution(channel, GaussianPrior(B_bar_mean, B_bar_cov), B_bar_mean, B_bar_cov, Sigma_0, delta, 10, num_points=16)
+    assert np.allclose(corrs_point, corrs_SE[-1], atol=5e-3)
+
+def test_phase_diagram_refines_along_the_step():
+  # A plane with a unit step along delta = 1 + eps. Bilinear interpolation is exact
+  # away from the step, so phase_diagram should only spend its evaluations near it.
+  eps_list = np.linspace(0, 1, 129)
+  delta_list = np.linspace(0.5, 3, 129)
+  tol = 0.01
+
+  def value(eps, delta):
+    return np.where(delta > 1 + eps, 1.0, 0.0) + 0.1 * eps + 0.05 * delta
+
+  num_calls = [0]
+  def evaluate(eps, delta):
+    num_calls[0] += len(eps)
+    return value(eps, delta)
+
+  values, evaluated = phase_diagram(evaluate, eps_list, delta_list, coarse_step=16, tol=tol)
+  eps, delta = np.meshgrid(eps_list, delta_list, indexing='ij')
+
+  # Every point is evaluated at most once, and far fewer than the whole grid are.
+  assert num_calls[0] == np.sum(evaluated)
+  assert np.sum(evaluated) < 0.15 * values.size
+  assert np.all(values[evaluated] == value(eps, delta)[evaluated])
+  assert np.max(np.abs(values - value(eps, delta))[~evaluated]) <= tol
+
+  # Leaving out the coarse lattice, most evaluations are within 4 grid steps of the
+  # step, a band that covers about 6% of the grid.
+  near_step = np.abs(delta - 1 - eps) < 4 * (delta_list[1] - delta_list[0])
+  coarse = np.zeros_like(evaluated)
+  coarse[::16, ::16] = coarse[-1, ::16] = coarse[::16, -1] = coarse[-1, -1] = True
+  refined = evaluated & ~coarse
+  assert np.mean(near_step) < 0.1
+  assert np.mean(near_step[refined]) > 0.5
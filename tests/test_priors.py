@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from matrix_gamp.priors import f_k_bayes_sparse_moments, f_k_ST_sparse_moments
+
+def random_M_k_B(K, seed=1):
+  rng = np.random.default_rng(seed)
+  A = rng.normal(size=(K, 2, 2))
+  return np.matmul(A, A.transpose(0,2,1)) + np.eye(2)
+
+def test_sparse_moments_stack_with_shared_eps_vec():
+  # A stack of M_k_B with one eps_vec for all of them gives the moments of each.
+  M_k_B = random_M_k_B(4)
+  E_B_f, E_f_f = f_k_bayes_sparse_moments(M_k_B, M_k_B, [0.5, 0.3], 0.2, 12)
+  for k in range(len(M_k_B)):
+    E_B_f_k, E_f_f_k = f_k_bayes_sparse_moments(M_k_B[k], M_k_B[k], [0.5, 0.3], 0.2, 12)
+    assert np.allclose(E_B_f[k], E_B_f_k)
+    assert np.allclose(E_f_f[k], E_f_f_k)
+
+def test_sparse_moments_stack_with_eps_vec_per_matrix():
+  M_k_B = random_M_k_B(3)
+  eps_vec = np.array([[0.5, 0.3], [0.2, 0.9], [1, 0.1]])
+  E_B_f, E_f_f = f_k_bayes_sparse_moments(M_k_B, M_k_B, eps_vec, 0.2, 12)
+  for k in range(len(M_k_B)):
+    E_B_f_k, E_f_f_k = f_k_bayes_sparse_moments(M_k_B[k], M_k_B[k], eps_vec[k], 0.2, 12)
+    assert np.allclose(E_B_f[k], E_B_f_k)
+    assert np.allclose(E_f_f[k], E_f_f_k)
+
+def test_ST_sparse_moments_stack():
+  M_k_B = random_M_k_B(3)
+  T_k_B = random_M_k_B(3, seed=2)
+  E_B_f, E_f_f = f_k_ST_sparse_moments(M_k_B, T_k_B, 1.1, [0.5, 0.3], 0.2, 12)
+  for k in range(len(M_k_B)):
+    E_B_f_k, E_f_f_k = f_k_ST_sparse_moments(M_k_B[k], T_k_B[k], 1.1, [0.5, 0.3], 0.2, 12)
+    assert np.allclose(E_B_f[k], E_B_f_k)
+    assert np.allclose(E_f_f[k], E_f_f_k)
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from matrix_gamp import ResultsStore, gamp_iteration_columns, SE_norm_sq_corr, norm_sq_corr
+
+def test_results_store_round_trip(tmp_path):
+  store = ResultsStore(str(tmp_path))
+  B_bar_cov = np.array([[1, 0.5], [0.5, 1]])
+  store.append({'n': 100, 'B_bar_cov': B_bar_cov}, {'iter': np.arange(3), 'corr1': np.array([0.1, 0.5, 0.9])})
+  store.append({'n': 200, 'B_bar_cov': B_bar_cov}, {'iter': np.arange(2), 'corr1': np.array([0.2, 0.6]), 'corr1_SE': np.array([0.25, 0.65])})
+  # The same parameters again replace their chunk.
+  store.append({'n': 100, 'B_bar_cov': B_bar_cov}, {'iter': np.arange(3), 'corr1': np.array([0.1, 0.5, 0.95])})
+  # An array parameter with other values is another chunk.
+  store.append({'n': 100, 'B_bar_cov': np.eye(2)}, {'iter': np.arange(1), 'corr1': np.array([0.3])})
+
+  assert len(store.chunks()) == 3
+  assert not any(name.endswith('.tmp') for name in os.listdir(tmp_path))
+  assert store.columns() == ['B_bar_cov', 'corr1', 'corr1_SE', 'iter', 'n']
+
+  table = store.load('n', 'iter', 'corr1', 'corr1_SE', 'B_bar_cov')
+  assert set(table) == {'n', 'iter', 'corr1', 'corr1_SE', 'B_bar_cov'}
+  assert table['B_bar_cov'].shape == (6, 2, 2)
+  rows = sorted(zip(table['n'], table['B_bar_cov'][:, 0, 1], table['iter'], table['corr1'], table['corr1_SE']))
+  expected = [(100, 0, 0, 0.3, np.nan),
+              (100, 0.5, 0, 0.1, np.nan), (100, 0.5, 1, 0.5, np.nan), (100, 0.5, 2, 0.95, np.nan),
+              (200, 0.5, 0, 0.2, 0.25), (200, 0.5, 1, 0.6, 0.65)]
+  np.testing.assert_array_equal(np.array(rows), np.array(expected))
+
+  # Only the requested columns come back.
+  assert list(store.load('corr1')) == ['corr1']
+  with pytest.raises(KeyError):
+    store.load('corr2')
+
+  assert ResultsStore(str(tmp_path / 'empty')).load('corr1')['corr1'].shape == (0,)
+
+def test_gamp_iteration_columns():
+  rng = np.random.default_rng(0)
+  p, L = 50, 2
+  B_bar_mean = np.zeros(L)
+  B_bar_cov = np.eye(L)
+  B = rng.normal(size=(p, L))
+  B_hat_storage = [rng.normal(size=(p, L)) for k in range(3)]
+  M_k_B_storage = [0.5 * np.eye(L), 0.8 * np.eye(L)]
+  def SE(M_k_B):
+    return SE_norm_sq_corr(M_k_B, B_bar_mean, B_bar_cov)
+
+  columns = gamp_iteration_columns(B, B_hat_storage, M_k_B_storage, SE, seconds=1.5)
+  assert sorted(columns) == ['MSE1', 'MSE2', 'corr1', 'corr1_SE', 'corr2', 'corr2_SE', 'iter', 'seconds']
+  np.testing.assert_array_equal(columns['iter'], np.arange(3))
+  np.testing.assert_allclose(columns['corr2'], [norm_sq_corr(B[:, 1], B_hat[:, 1]) for B_hat in B_hat_storage])
+  assert np.isnan(columns['corr1_SE'][0])
+  np.testing.assert_allclose(columns['corr1_SE'][1:], [SE(M)[0] for M in M_k_B_storage])
+  np.testing.assert_array_equal(columns['seconds'], np.full(3, 1.5))
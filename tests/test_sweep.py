@@ -0,0 +1,70 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from matrix_gamp import run_sweep
+from matrix_gamp import sweep
+
+calls = []
+
+def cell(x, w, dtype, scale=1):
+  calls.append((x, dtype))
+  return np.dot(w, np.arange(len(w), dtype=dtype)) * x * scale
+
+def test_run_sweep_checkpoints(tmp_path):
+  # Every cell is written to checkpoint_dir. After one checkpoint is deleted, a rerun
+  # only computes that cell and loads the others.
+  args_list = [(x, np.array([1.0, x]), dtype) for x in range(3) for dtype in (np.float32, np.float64)]
+  expected = [cell(*args) for args in args_list]
+
+  del calls[:]
+  results = run_sweep(cell, args_list, checkpoint_dir=str(tmp_path))
+  assert len(calls) == len(args_list)
+  for a, b in zip(results, expected):
+    assert a == b and a.dtype == b.dtype
+  files = sorted(os.listdir(tmp_path))
+  assert len(files) == len(args_list)
+  assert not any(f.endswith('.tmp') for f in files)
+
+  os.remove(sweep.checkpoint_path(str(tmp_path), cell, args_list[3]))
+  del calls[:]
+  results = run_sweep(cell, args_list, checkpoint_dir=str(tmp_path))
+  assert calls == [(args_list[3][0], args_list[3][2])]
+  for a, b in zip(results, expected):
+    assert a == b and a.dtype == b.dtype
+
+  # Keyword arguments give cells of their own.
+  del calls[:]
+  results = run_sweep(cell, args_list, checkpoint_dir=str(tmp_path), task_kwargs={'scale': 2})
+  assert len(calls) == len(args_list)
+  assert results == [2 * b for b in expected]
+
+def test_checkpoint_path_keys():
+  # The file is keyed by the task name and the values of its arguments, numpy arrays
+  # and dtypes included.
+  path = sweep.checkpoint_path('ckpt', cell, (1, np.array([1.0, 2.0]), np.float32))
+  assert path == sweep.checkpoint_path('ckpt', cell, (1, np.array([1.0, 2.0]), np.float32))
+  assert path != sweep.checkpoint_path('ckpt', cell, (1, np.array([1.0, 3.0]), np.float32))
+  assert path != sweep.checkpoint_path('ckpt', cell, (1, np.array([1.0, 2.0]), np.float64))
+  assert path != sweep.checkpoint_path('ckpt', test_checkpoint_path_keys, (1, np.array([1.0, 2.0]), np.float32))
+  assert os.path.basename(path).startswith('cell_')
+
+def test_save_checkpoint_is_atomic(tmp_path, monkeypatch):
+  # A crash before the rename leaves no checkpoint, so the cell is run again, and
+  # an existing checkpoint is only ever replaced by a complete one.
+  path = str(tmp_path / 'cell.pkl')
+  sweep.save_checkpoint(path, 1)
+
+  def crash(src, dst):
+    raise OSError('killed')
+  monkeypatch.setattr(os, 'replace', crash)
+  with pytest.raises(OSError):
+    sweep.save_checkpoint(path, 2)
+  assert sweep.load_checkpoint(path) == 1
+
+  monkeypatch.undo()
+  sweep.save_checkpoint(path, 2)
+  assert sweep.load_checkpoint(path) == 2